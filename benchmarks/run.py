@@ -0,0 +1,157 @@
+"""
+Runs the scenario benchmarks and compares them with a baseline.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 1000,10000,100000,1000000 --only defaults,columns
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from collections import OrderedDict
+
+from scenarious import Scenario
+from benchmarks.scenarios import BENCHMARKS
+
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+
+
+def run_benchmark(name, size, repeat=3, memory=True):
+    """
+    Builds the scenario of a benchmark repeat times
+    :return: dict with the best time, throughput (entities/s) and peak memory (bytes) of the build
+    """
+    benchmark = BENCHMARKS[name]
+    timings = []
+
+    for _ in range(repeat):
+        source, handlers, kwargs = benchmark(size)
+        gc.collect()
+
+        started = time.perf_counter()
+        Scenario.load(source, handlers, **kwargs)
+        timings.append(time.perf_counter() - started)
+
+    result = OrderedDict([
+        ('benchmark', name),
+        ('size', size),
+        ('seconds', min(timings)),
+        ('entities_per_second', size / min(timings)),
+    ])
+
+    if memory:
+        # Tracing slows everything down, so memory is measured on a build of its own
+        source, handlers, kwargs = benchmark(size)
+        gc.collect()
+        tracemalloc.start()
+
+        try:
+            Scenario.load(source, handlers, **kwargs)
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Adds the ratio against the baseline to every result
+    :return: list of results whose throughput dropped more than tolerance
+    """
+    previous = dict(((r['benchmark'], r['size']), r) for r in baseline.get('results', []))
+    regressions = []
+
+    for result in results:
+        base = previous.get((result['benchmark'], result['size']))
+        if base is None:
+            continue
+
+        result['baseline_ratio'] = result['entities_per_second'] / base['entities_per_second']
+        if result['baseline_ratio'] < 1 - tolerance:
+            regressions.append(result)
+
+    return regressions
+
+
+def table(results):
+    header = ('benchmark', 'size', 'seconds', 'entities/s', 'peak memory (MB)', 'vs baseline')
+    rows = [(r['benchmark'], str(r['size']), '{:.3f}'.format(r['seconds']),
+             '{:,.0f}'.format(r['entities_per_second']),
+             '{:.1f}'.format(r['peak_memory'] / 1024.0 / 1024) if 'peak_memory' in r else '',
+             '{:.2f}x'.format(r['baseline_ratio']) if 'baseline_ratio' in r else '') for r in results]
+
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    line = '  '.join('{{:{}{}}}'.format('<' if i == 0 else '>', w) for i, w in enumerate(widths))
+
+    return '\n'.join([line.format(*header)] + [line.format(*row) for row in rows])
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Scenario load and build benchmarks')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma separated number of entities of every scenario')
+    parser.add_argument('--only', help='comma separated benchmarks to run, out of: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3, help='builds per benchmark, the best one is reported')
+    parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='throughput drop against the baseline considered a regression')
+    parser.add_argument('--save-baseline', metavar='PATH', help='store the results as the new baseline')
+    parser.add_argument('--output', metavar='PATH', help='store the results as json')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        sys.exit('Unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    results = []
+    for name in names:
+        for size in sizes:
+            try:
+                results.append(run_benchmark(name, size, args.repeat, not args.no_memory))
+
+            except ImportError as e:
+                print('Skipping {}: {}'.format(name, e))
+                break
+
+    try:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    except IOError:
+        regressions = []
+
+    print(table(results))
+
+    report = OrderedDict([('python', platform.python_version()), ('machine', platform.machine()),
+                          ('results', results)])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if regressions:
+        print('\nThroughput regressions beyond {:.0%}: {}'.format(
+            args.tolerance, ', '.join('{} ({})'.format(r['benchmark'], r['size']) for r in regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
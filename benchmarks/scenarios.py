@@ -0,0 +1,137 @@
+"""
+Synthetic scenarios for the benchmarks. Every benchmark is a function taking the number of entities
+and returning (source, type handlers, Scenario.load kwargs).
+"""
+import random
+from collections import OrderedDict
+from datetime import date
+
+from scenarious import TypeHandler
+from scenarious.type_handlers.base import faker
+from scenarious.type_handlers.columns import IntegerColumn, ChoiceColumn, DateColumn, FakerColumn
+
+
+class Record(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class RecordTypeHandler(TypeHandler):
+
+    @classmethod
+    def _do_create(cls, data):
+        return Record(**data)
+
+
+class UserTypeHandler(RecordTypeHandler):
+    __type_name__ = 'user'
+
+    name = lambda: faker.name()
+    email = lambda: faker.email()
+    age = lambda: random.randint(18, 80)
+
+
+class ColumnUserTypeHandler(RecordTypeHandler):
+    __type_name__ = 'user'
+
+    name = FakerColumn('name', pool_size=10000)
+    email = FakerColumn('email')
+    age = IntegerColumn(18, 80)
+    country = ChoiceColumn(['AR', 'US', 'UY'], weights=[5, 3, 1])
+    signed_up = DateColumn(date(2015, 1, 1), date(2020, 1, 1))
+
+
+class PostTypeHandler(RecordTypeHandler):
+    __type_name__ = 'post'
+    __requires__ = ['author']
+
+    title = 'benchmark post'
+
+
+class NodeTypeHandler(RecordTypeHandler):
+    __type_name__ = 'node'
+    __requires__ = ['parent']
+
+
+class EventTypeHandler(RecordTypeHandler):
+    __type_name__ = 'event'
+    __requires__ = ['starts', 'ends']
+
+    @classmethod
+    def _is_datetime_attribute(cls, attr):
+        return attr in ('starts', 'ends')
+
+
+def defaults(n):
+    """
+    Objects built only from lambda defaults
+    """
+    return {'users': n}, [UserTypeHandler], {}
+
+
+def columns(n):
+    """
+    Objects built only from column generators
+    """
+    return {'users': n}, [ColumnUserTypeHandler], {}
+
+
+def streaming(n):
+    """
+    Default definitions built keeping only referenced objects
+    """
+    return {'users': n, 'posts': [{'author': '$user_{}'.format(n)}]}, [UserTypeHandler, PostTypeHandler], \
+        {'streaming': True}
+
+
+def references(n):
+    """
+    Every post references a user and the title of another post
+    """
+    users = n // 10 or 1
+    posts = [{'author': '$user_{}'.format(i % users + 1), 'title': '$post_{}.title'.format(i)} if i else
+             {'author': '$user_1'} for i in range(n - users)]
+
+    return OrderedDict([('users', users), ('posts', posts)]), [UserTypeHandler, PostTypeHandler], {}
+
+
+def attribute_chains(n, depth=8):
+    """
+    Every node references the name of the node depth levels up through its parents
+    """
+    nodes = []
+    for i in range(n):
+        if i < depth:
+            nodes.append({'parent': '$node_{}'.format(i) if i else None, 'name': 'node {}'.format(i)})
+        else:
+            nodes.append({'parent': '$node_{}'.format(i), 'name': '$node_{}{}.name'.format(i, '.parent' * (depth - 1))})
+
+    return {'nodes': nodes}, [NodeTypeHandler], {}
+
+
+def dates(n):
+    """
+    Rows with ISO and free text dates to parse
+    """
+    events = [{'starts': '2018-05-{:02d} 10:30'.format(i % 28 + 1), 'ends': 'May {} 2018 11:{:02d}'.format(
+        i % 28 + 1, i % 60)} for i in range(n)]
+
+    return {'events': events}, [EventTypeHandler], {}
+
+
+def sqlalchemy(n):
+    """
+    Users and posts inserted in bulk into an in-memory SQLite database in a single transaction
+    """
+    from benchmarks import sql_models
+
+    session = sql_models.new_session()
+    users = n // 10 or 1
+    posts = [{'user_id': '$user_{}.id'.format(i % users + 1)} for i in range(n - users)]
+
+    return OrderedDict([('users', users), ('posts', posts)]), sql_models.handlers(session), {}
+
+
+BENCHMARKS = OrderedDict((f.__name__, f) for f in (defaults, columns, streaming, references, attribute_chains,
+                                                   dates, sqlalchemy))
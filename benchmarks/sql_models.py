@@ -0,0 +1,52 @@
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from scenarious.type_handlers.base import faker
+from scenarious.type_handlers.sql_alchemy import SQLAlchemyTypeHandler
+
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = 'users'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+
+
+class Post(Base):
+    __tablename__ = 'posts'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(64), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+
+
+def new_session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def handlers(session):
+    class UserTypeHandler(SQLAlchemyTypeHandler):
+        __type_name__ = 'user'
+        __model__ = User
+        __session__ = session
+        __bulk__ = True
+        __transactional__ = True
+
+        name = lambda: faker.name()
+
+    class PostTypeHandler(SQLAlchemyTypeHandler):
+        __type_name__ = 'post'
+        __model__ = Post
+        __session__ = session
+        __requires__ = ['user_id']
+        __bulk__ = True
+        __transactional__ = True
+
+        title = 'benchmark post'
+
+    return [UserTypeHandler, PostTypeHandler]
@@ -1,4 +1,6 @@
 from .scenario import Scenario, ScenariousException
+from .plan import ScenarioPlan
+from .sharding import Shard
 from .store_handler import EntityStore, EntityStoreException
 from .type_handlers.base import TypeHandlerLoader, TypeHandler, TypeHandlerException
 from .type_handlers.sql_alchemy import SQLAlchemyTypeHandler
@@ -0,0 +1,165 @@
+import os
+import zlib
+import pickle
+import inspect
+import hashlib
+import tempfile
+from collections import namedtuple
+
+import six
+
+from .errors import ScenariousException
+
+
+# Bumped whenever the layout of the artifacts changes, so old ones are compiled again
+ARTIFACT_VERSION = 1
+
+_MAGIC = b'SCENARIOUS-ARTIFACT'
+
+
+# A reference to another entity of the artifact, resolved when the artifact is loaded
+Link = namedtuple('Link', ['type_name', 'identifier', 'attrs'])
+
+
+def _code_fingerprint(code):
+    consts = tuple(_code_fingerprint(c) if inspect.iscode(c) else _value_fingerprint(c) for c in code.co_consts)
+    return repr((code.co_code, consts, code.co_names))
+
+
+def _value_fingerprint(value, nested=False):
+    """
+    :return: a string that only changes with the value, unlike the repr of functions and most objects
+             which includes their memory address
+    """
+    # Functions, lambdas and the functions of classmethods and staticmethods
+    code = getattr(getattr(value, '__func__', value), '__code__', None)
+    if code is not None:
+        return _code_fingerprint(code)
+
+    if value is None or isinstance(value, (bool, float, six.integer_types, six.string_types, bytes)):
+        return repr(value)
+
+    if isinstance(value, dict):
+        return repr(sorted((repr(k), _value_fingerprint(v, nested)) for k, v in value.items()))
+
+    if isinstance(value, (list, tuple)):
+        return repr([_value_fingerprint(v, nested) for v in value])
+
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(_value_fingerprint(v, nested) for v in value))
+
+    # Other objects by their class and, unless nested in another one, their attributes
+    name = '{}.{}'.format(type(value).__module__, type(value).__name__)
+    if nested or not hasattr(value, '__dict__'):
+        return name
+
+    return name + _value_fingerprint(vars(value), True)
+
+
+def handler_fingerprint(handler):
+    """
+    :return: a string that changes whenever the code of the handler (or of any of its base classes) changes
+    """
+    parts = []
+
+    for klass in inspect.getmro(handler):
+        if klass is object:
+            continue
+
+        try:
+            source = inspect.getsource(klass)
+
+        except (IOError, OSError, TypeError):
+            # Classes built on the fly have no source, their attributes are the best we have
+            source = repr(sorted((k, _value_fingerprint(v)) for k, v in vars(klass).items() if not k.startswith('__')))
+
+        parts.append('{}.{}\n{}'.format(klass.__module__, klass.__name__, source))
+
+    return '\n'.join(parts)
+
+
+def artifact_key(source_digests, handlers, seed=None, shard=None):
+    """
+    Key of the artifact of a scenario, built out of everything the compiled data depends on
+    :param source_digests: digests of the content of every source of the scenario, in order
+    :param handlers: type handlers of the scenario
+    :param seed: seed of the scenario
+    :param shard: Shard of the scenario
+    :return: hex digest
+    """
+    digest = hashlib.sha256('{}\n{}\n{}'.format(ARTIFACT_VERSION, seed, '\n'.join(source_digests)).encode('utf-8'))
+
+    if shard is not None:
+        digest.update(repr((shard.index, shard.count, sorted(shard.ranges.items()), shard.assign_ids)).encode('utf-8'))
+
+    for handler in sorted(set(handlers), key=lambda h: (h.__module__, h.__name__)):
+        digest.update(handler_fingerprint(handler).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def write_artifact(path, key, artifact):
+    """
+    Writes an artifact as zlib compressed pickle, replacing any previous one at once
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_MAGIC + b' ' + key.encode('ascii') + b'\n')
+            f.write(zlib.compress(pickle.dumps(artifact, pickle.HIGHEST_PROTOCOL)))
+
+        os.replace(tmp_path, path)
+
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def read_artifact(path, key):
+    """
+    :return: the artifact stored at path, None if there's none or it was compiled from something else
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.readline() != _MAGIC + b' ' + key.encode('ascii') + b'\n':
+                return None
+
+            return pickle.loads(zlib.decompress(f.read()))
+
+    except (IOError, OSError):
+        return None
+
+    except (zlib.error, pickle.UnpicklingError, EOFError) as e:
+        ScenariousException.reraise("Corrupt scenario artifact '{}'. Detail: {}".format(path, e), e)
+
+
+def find_links(value, path=()):
+    """
+    :return: list of (path, Link) with every link found in the data
+    """
+    if isinstance(value, Link):
+        return [(path, value)]
+
+    if isinstance(value, dict):
+        items = value.items()
+
+    elif isinstance(value, list):
+        items = enumerate(value)
+
+    else:
+        return []
+
+    links = []
+    for k, v in items:
+        links.extend(find_links(v, path + (k,)))
+
+    return links
+
+
+def set_path(data, path, value):
+    for key in path[:-1]:
+        data = data[key]
+
+    data[path[-1]] = value
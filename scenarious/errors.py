@@ -13,3 +13,7 @@ class BaseError(Exception):
     @classmethod
     def reraise(cls, msg, inner_ex):
         reraise(cls, msg, inner_ex)
+
+
+class ScenariousException(BaseError):
+    pass
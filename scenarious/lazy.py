@@ -0,0 +1,55 @@
+import six
+
+
+class LazyEntities(object):
+    """
+    The objects of a type of a lazy scenario. Objects accessed by id, alias or position are created
+    on the spot, along with everything they reference. Anything else creates the whole type first
+    and then behaves like the EntityManager of the type.
+    """
+
+    def __init__(self, scenario, type_name):
+        self.type_name = type_name
+        self._scenario = scenario
+
+    def _manager(self):
+        return self._scenario._entity_store.all(self.type_name)
+
+    def _all(self):
+        self._scenario._materialize_type(self.type_name)
+        return self._manager()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        prefix = self.type_name + '_'
+        if not name.startswith(prefix):
+            return getattr(self._all(), name)
+
+        self._scenario._materialize_ref(self.type_name, name[len(prefix):])
+        return getattr(self._manager(), name)
+
+    def __getitem__(self, key):
+        if isinstance(key, six.string_types):
+            self._scenario._materialize_ref(self.type_name, key)
+            return self._manager()[key]
+
+        if isinstance(key, int) and key >= 0:
+            identifier = self._scenario._materialize_at(self.type_name, key)
+            if identifier is not None:
+                return self._scenario._entity_store.get(self.type_name, identifier)
+
+        return self._all()[key]
+
+    def __iter__(self):
+        return iter(self._all())
+
+    def __len__(self):
+        return len(self._all())
+
+    def __contains__(self, item):
+        return item in self._all()
+
+    def __repr__(self):
+        return repr(self._all())
@@ -0,0 +1,63 @@
+import random
+from collections import deque
+
+try:
+    import numpy
+
+except ImportError:
+    numpy = None
+
+
+def init_worker():
+    """
+    Reseeds the random generators of a worker process, forked workers would generate the same values otherwise
+    """
+    from .type_handlers.base import faker
+
+    random.seed()
+    faker.seed_instance(random.getrandbits(64))
+
+    if numpy is not None:
+        numpy.random.seed(random.getrandbits(32))
+
+
+def prepare_chunk(handler, definitions, seeds=None):
+    """
+    Builds the data of a chunk of objects in a worker process
+    :return: list of dicts ready to be created by the handler
+    """
+    return handler.prepare_many(definitions, seeds)
+
+
+def prepare_chunks(pool, handler, get_definitions, count, chunk_size, depth, get_seeds=None):
+    """
+    Generates the data of count objects in a process pool, chunk by chunk.
+    At most depth chunks are generated ahead of the consumer, so memory stays bounded.
+    :param get_definitions: function returning the definitions of the objects of a chunk given its start and size
+    :param get_seeds: function returning the seeds of the objects of a chunk given its start and size
+    :return: generator of (start, list of data dicts) in order
+    """
+    starts = iter(range(0, count, chunk_size))
+    pending = deque()
+
+    def submit():
+        for start in starts:
+            size = min(chunk_size, count - start)
+            seeds = get_seeds(start, size) if get_seeds else None
+            pending.append((start, pool.submit(prepare_chunk, handler, get_definitions(start, size), seeds)))
+            return
+
+    for _ in range(depth):
+        submit()
+
+    try:
+        while pending:
+            start, future = pending.popleft()
+            data = future.result()
+            submit()
+
+            yield start, data
+
+    finally:
+        for _, future in pending:
+            future.cancel()
@@ -0,0 +1,715 @@
+import heapq
+import bisect
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from .errors import ScenariousException
+from .store_handler import EntityID, EntityStoreException
+
+
+class DefaultDefinitions(object):
+    """
+    A number of definitions built only from the type handler defaults, as in 'users: 1000'.
+    Kept as a count instead of a list of empty dicts so big scenarios don't need to be materialized.
+    """
+
+    def __init__(self, count):
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for _ in range(self.count):
+            yield {}
+
+    def __repr__(self):
+        return "<DefaultDefinitions {}>".format(self.count)
+
+
+class PlannedEntity(object):
+    """
+    A single entity of the scenario with every reference already located and parsed.
+
+    References are kept as (path, Reference) where path is the chain of keys/indexes
+    needed to reach the reference inside the definition.
+
+    Consecutive default definitions of a type without custom ids are planned as a single entity
+    with a count, covering the ids from identifier to identifier + count - 1.
+    """
+
+    def __init__(self, type_name, index, raw_id, alias, definition, count=1):
+        self.type_name = type_name
+        self.index = index
+        self.raw_id = raw_id
+        self.alias = alias
+        self.definition = definition
+        self.count = count
+        self.identifier = None
+        # Id the entity is stored with, None to let the store generate it
+        self.store_id = raw_id
+        # Position of the entity among the objects of its type once they are all in the store
+        self.position = None
+        self.references = []
+        self.special_methods = []
+        self.dependencies = []
+
+    def __repr__(self):
+        return "<PlannedEntity {}_{}>".format(self.type_name, self.identifier)
+
+    def entity_id(self):
+        return EntityID(self.store_id, self.alias)
+
+    def slice(self, offset, count):
+        """
+        Gets a part of an entity covering many default definitions
+        :param offset: position of the first object of the part within the entity
+        :param count: number of objects in the part
+        :return: PlannedEntity
+        """
+        part = PlannedEntity(self.type_name, self.index + offset, None, None, self.definition, count=count)
+        part.identifier = part.store_id = self.identifier + offset
+        part.position = self.position + offset
+        part.references = self.references
+        part.special_methods = self.special_methods
+        return part
+
+    def identifiers(self):
+        return range(self.identifier, self.identifier + self.count) if self.count > 1 else [self.identifier]
+
+    def identifier_at(self, offset):
+        """
+        :return: id of the object at offset, entities covering many default definitions have consecutive ids
+        """
+        return self.identifier + offset if self.count > 1 else self.identifier
+
+    def referenced_types(self):
+        types = set(ref.type_name for _, ref in self.references)
+        types.update(ref.type_name for _, _, ref in self.special_methods if ref)
+        return types
+
+    def resolve(self, get_reference):
+        """
+        Builds the definition to hand over to the type handler, replacing every reference
+        by the value returned by get_reference(reference)
+        """
+        obj_def = dict(self.definition)
+        copied = set()
+
+        for path, ref in self.references:
+            container = obj_def
+            for key in path[:-1]:
+                child = container[key]
+                if id(child) not in copied:
+                    child = dict(child) if isinstance(child, dict) else list(child)
+                    container[key] = child
+                    copied.add(id(child))
+
+                container = child
+
+            container[path[-1]] = get_reference(ref)
+
+        return obj_def
+
+
+class ScenarioPlan(object):
+    """
+    A compiled scenario: every raw definition parsed once, references extracted into a type-level
+    and entity-level dependency graph and entities sorted in the order they must be created.
+
+    A plan doesn't hold any created object, so it can be executed as many times as needed.
+    """
+
+    def __init__(self, entities, type_order, type_dependencies, reference_counts, reference_targets,
+                 external_references=None, lookups=None):
+        self.entities = entities
+        self.type_order = type_order
+        self.type_dependencies = type_dependencies
+        # How many times every entity is referenced by another one, by type and id
+        self.reference_counts = reference_counts
+        # Id of the entity every (type, reference id) points to
+        self.reference_targets = reference_targets
+        # Id of the entity every (type, reference id) created by another shard points to
+        self.external_references = external_references or {}
+        # Function finding the entity a reference id points to, by type
+        self.lookups = lookups or {}
+        self._entities_by_type = None
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    @classmethod
+    def compile(cls, scenario):
+        """
+        Builds a plan out of the raw definitions of the given scenario
+        :param scenario: Scenario to compile
+        :return: A ScenarioPlan
+        """
+        entities_by_type = cls._parse_definitions(scenario)
+        lookups = cls._assign_identifiers(scenario, entities_by_type)
+
+        owners = None
+        if scenario._shard is not None:
+            owners = cls._shard_entities(scenario._shard, entities_by_type)
+
+        reference_counts, reference_targets, external_references = cls._link_references(
+            entities_by_type, lookups, owners)
+
+        type_dependencies = OrderedDict()
+        for type_name, entities in entities_by_type.items():
+            deps = set()
+            for entity in entities:
+                deps.update(entity.referenced_types())
+
+            deps.discard(type_name)
+            type_dependencies[type_name] = set(t for t in deps if t in entities_by_type)
+
+        type_order = cls._sort_types(scenario, type_dependencies)
+        entities = cls._sort_entities(entities_by_type, type_order)
+
+        return cls(entities, type_order, type_dependencies, reference_counts, reference_targets, external_references,
+                   lookups)
+
+    def entities_of(self, type_name):
+        """
+        :return: list of the planned entities of a type, in the order their objects end up in the store
+        """
+        if self._entities_by_type is None:
+            by_type = {}
+            for entity in self.entities:
+                by_type.setdefault(entity.type_name, []).append(entity)
+
+            self._entities_by_type = dict((t, sorted(e, key=lambda e: e.position)) for t, e in by_type.items())
+
+        return self._entities_by_type.get(type_name, [])
+
+    def find(self, type_name, ref_id):
+        """
+        Finds the planned object an id or alias points to
+        :return: (PlannedEntity, identifier of the object), None if there's no such object in the plan
+        """
+        lookup = self.lookups.get(type_name)
+        target = lookup(ref_id) if lookup is not None else None
+        if target is None:
+            return None
+
+        return target, int(ref_id) if target.count > 1 else target.identifier
+
+    def at(self, type_name, position):
+        """
+        Finds the planned object at a position among the objects of its type
+        :return: (PlannedEntity, identifier of the object), None if there's no such object in the plan
+        """
+        offset = 0
+        for entity in self.entities_of(type_name):
+            if position < offset + entity.count:
+                return entity, entity.identifier + position - offset if entity.count > 1 else entity.identifier
+
+            offset += entity.count
+
+        return None
+
+    def execute(self, scenario, executor=None, pool=None):
+        """
+        Creates every pending entity of the plan in the scenario, see pending_entities.
+
+        Consecutive entities of the same type that don't depend on each other are handed over to
+        the type handler together, so handlers can create them in bulk.
+
+        :param scenario: Scenario to create the entities in
+        :param executor: when given, entities without pending dependencies are created concurrently on it
+        :param pool: process pool to generate the data of default definitions on
+        """
+        entities = self.pending_entities(scenario)
+
+        if executor is not None:
+            self._execute_concurrently(scenario, executor, entities, pool)
+            return
+
+        for batch in self.batches(entities):
+            scenario._load_entities(batch, pool=pool)
+
+    def pending_entities(self, scenario):
+        """
+        Gets the entities the scenario didn't create yet. For types it already built, those are the ones
+        defined after the ones it created, so updating a built scenario only creates what was added.
+        Types already present in the store that the scenario didn't build are skipped.
+        :param scenario: Scenario to create the entities in
+        :return: list of PlannedEntity
+        """
+        pending = []
+
+        for entity in self.entities:
+            created = scenario._materialized.get(entity.type_name)
+
+            if created is None:
+                if not scenario._entity_store.has_type(entity.type_name):
+                    pending.append(entity)
+
+            elif entity.index >= created:
+                pending.append(entity)
+
+            elif entity.index + entity.count > created:
+                pending.append(entity.slice(created - entity.index, entity.index + entity.count - created))
+
+        store = scenario._entity_store
+        for entity in pending:
+            if entity.type_name in scenario._materialized and \
+                    any(store.has_object(entity.type_name, i) for i in entity.identifiers()):
+                # Objects already created must keep their ids, like the ones added with add_<type>
+                raise ScenariousException("Can't build type '{}' incrementally, objects added to the scenario since "
+                                          "it was built took the ids of the new definitions"
+                                          .format(entity.type_name))
+
+        return pending
+
+    def materialized(self, scenario):
+        """
+        Gets how many definitions of every type the scenario will have created once the plan is executed,
+        to be called before executing it
+        :param scenario: Scenario to create the entities in
+        :return: dict with the number of definitions by type, for the types the plan creates
+        """
+        counts = {}
+        for entity in self.entities:
+            if entity.type_name in scenario._materialized or not scenario._entity_store.has_type(entity.type_name):
+                counts[entity.type_name] = max(counts.get(entity.type_name, 0), entity.index + entity.count)
+
+        return counts
+
+    def _execute_concurrently(self, scenario, executor, entities, pool=None):
+        planned = set(entities)
+        pending_deps = {}
+        dependents = {}
+
+        for entity in entities:
+            deps = [d for d in entity.dependencies if d in planned and d is not entity]
+            pending_deps[entity] = len(deps)
+            for dep in deps:
+                dependents.setdefault(dep, []).append(entity)
+
+        running = {}
+
+        def submit(e):
+            # Entities get their predicted ids, so the result doesn't depend on the completion order
+            running[executor.submit(scenario._load_entities, [e], predicted_ids=True, pool=pool)] = e
+
+        for entity in entities:
+            if not pending_deps[entity]:
+                submit(entity)
+
+        try:
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    entity = running.pop(future)
+                    future.result()
+
+                    for dependent in dependents.get(entity, []):
+                        pending_deps[dependent] -= 1
+                        if not pending_deps[dependent]:
+                            submit(dependent)
+
+        except Exception:
+            for future in running:
+                future.cancel()
+
+            wait(list(running))
+            raise
+
+        self._restore_order(scenario, entities)
+
+    async def aexecute(self, scenario, concurrency=None):
+        """
+        Creates every planned entity in the scenario using the handlers' async creation. Every entity
+        waits for the ones it references and then they are all gathered.
+
+        :param scenario: Scenario to create the entities in
+        :param concurrency: maximum number of entities being created at the same time
+        """
+        entities = self.pending_entities(scenario)
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        tasks = OrderedDict()
+
+        async def load(entity):
+            # Entities are sorted, so every dependency already has its task
+            for dep in entity.dependencies:
+                if dep in tasks and dep is not entity:
+                    await tasks[dep]
+
+            if semaphore is None:
+                return await scenario._aload_entity(entity)
+
+            async with semaphore:
+                return await scenario._aload_entity(entity)
+
+        for entity in entities:
+            tasks[entity] = asyncio.ensure_future(load(entity))
+
+        try:
+            await asyncio.gather(*tasks.values())
+
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        self._restore_order(scenario, entities)
+
+    def _restore_order(self, scenario, entities):
+        """
+        Leaves objects in the store in the same order a serial build would
+        """
+        by_type = OrderedDict()
+        for entity in entities:
+            by_type.setdefault(entity.type_name, []).append(entity)
+
+        for type_name, type_entities in by_type.items():
+            identifiers = []
+            for entity in sorted(type_entities, key=lambda e: e.position):
+                identifiers.extend(entity.identifiers())
+
+            scenario._entity_store._reorder(
+                type_name, identifiers, [e.alias for e in sorted(type_entities, key=lambda e: e.index) if e.alias])
+
+    def batches(self, entities=None, skip_types=()):
+        """
+        Splits the planned entities into runs of the same type without dependencies between them
+        :param entities: the planned entities to split, all of them by default
+        :param skip_types: types to leave out
+        :return: generator of lists of PlannedEntity
+        """
+        batch = []
+        in_batch = set()
+
+        for entity in (self.entities if entities is None else entities):
+            if entity.type_name in skip_types:
+                continue
+
+            if batch and (entity.type_name != batch[0].type_name or entity.count > 1 or batch[0].count > 1
+                          or any(d in in_batch for d in entity.dependencies)):
+                yield batch
+                batch = []
+                in_batch = set()
+
+            batch.append(entity)
+            in_batch.add(entity)
+
+        if batch:
+            yield batch
+
+    @classmethod
+    def _parse_definitions(cls, scenario):
+        entities_by_type = OrderedDict()
+
+        for raw_type, type_def in scenario._raw_data.items():
+            type_name = scenario._get_type_name(raw_type)
+            if type_name in entities_by_type:
+                continue
+
+            if type(type_def) is list:
+                objects = type_def
+
+            elif type(type_def) is dict:
+                objects = [type_def]
+
+            elif type(type_def) is int:
+                objects = [DefaultDefinitions(type_def)]
+
+            else:
+                raise ScenariousException(
+                    "Type definition '{}' must be a list, dict or int. Got '{}' instead"
+                    .format(type_name, type(type_def)))
+
+            handler = scenario._get_type_handler(type_name)
+            id_key = scenario._entity_store.ID
+            # Without custom ids, ids just follow the definition order
+            sequential = not any(isinstance(data, dict) and id_key in data for data in objects)
+            entities = []
+            index = 0
+
+            for data in objects:
+                if isinstance(data, DefaultDefinitions):
+                    if sequential and data.count > 1:
+                        entities.append(PlannedEntity(type_name, index, None, None, {}, count=data.count))
+                        index += data.count
+                        continue
+
+                    data = [{}] * data.count
+
+                else:
+                    data = [data]
+
+                for obj in data:
+                    try:
+                        entity_id, obj_def = scenario._entity_store.parse_obj_def(dict(obj))
+
+                    except Exception as e:
+                        ScenariousException.reraise(
+                            "Error loading type '{}'. Detail: {}".format(type_name, e), e)
+
+                    entity = PlannedEntity(type_name, index, entity_id.identifier, entity_id.alias, obj_def)
+                    cls._collect_references(scenario, handler, obj_def, entity)
+                    entities.append(entity)
+                    index += 1
+
+            entities_by_type[type_name] = entities
+
+        return entities_by_type
+
+    @classmethod
+    def _collect_references(cls, scenario, handler, obj_def, entity):
+        ref_handler = scenario._ref_handler
+        methods = []
+
+        entity.references = ref_handler.find_references(obj_def, skip_key=handler.is_method, skipped=methods)
+
+        for path, param in methods:
+            ref = ref_handler.compile(param) if ref_handler.is_reference(param) else None
+            entity.special_methods.append((handler.get_special_method(path[-1]), param, ref))
+
+    @classmethod
+    def _assign_identifiers(cls, scenario, entities_by_type):
+        """
+        Predicts the identifier every entity will get. Types without custom ids get consecutive ids, for the rest
+        the id assignment of the scenario's entity store is replayed.
+        :return: dict with a function finding the entity a reference id points to, by type
+        """
+        scratch = scenario._entity_store.__class__()
+        lookups = {}
+
+        for type_name, entities in entities_by_type.items():
+            if all(entity.raw_id is None for entity in entities):
+                lookups[type_name] = cls._assign_sequential_identifiers(type_name, entities)
+                continue
+
+            for entity in entities:
+                try:
+                    scratch.add(entity, type_name=type_name, entity_id=entity.entity_id())
+
+                except EntityStoreException as e:
+                    ScenariousException.reraise(
+                        "Error loading type '{}'. Detail: {}".format(type_name, e), e)
+
+            for position, (identifier, entity) in enumerate(scratch._objects[type_name].items()):
+                entity.identifier = identifier
+                entity.position = position
+
+            lookups[type_name] = lambda ref_id, type_name=type_name: scratch.get(type_name, ref_id)
+
+        return lookups
+
+    @classmethod
+    def _shard_entities(cls, shard, entities_by_type):
+        """
+        Leaves only the entities owned by the shard, splitting the ones covering many default definitions if needed
+        :return: dict with the owned parts of every entity that is at least partially owned
+        """
+        owners = {}
+
+        for type_name, entities in entities_by_type.items():
+            id_range = shard.id_range(type_name)
+            entities = sorted(entities, key=lambda e: e.position)
+
+            if id_range is None:
+                start, end = shard.block(sum(e.count for e in entities))
+
+            else:
+                start, end = id_range
+                if any(not isinstance(e.identifier, int) for e in entities):
+                    raise ScenariousException("Id ranges can only be used with integer ids, type '{}' has custom ids"
+                                              .format(type_name))
+
+            owned = []
+            offset = 0
+
+            for entity in entities:
+                first = entity.identifier if id_range else offset
+                offset += entity.count
+
+                part_start, part_end = max(first, start), min(first + entity.count, end)
+                if part_start >= part_end:
+                    continue
+
+                part = entity if part_end - part_start == entity.count else \
+                    entity.slice(part_start - first, part_end - part_start)
+
+                owners.setdefault(entity, []).append(part)
+                owned.append(part)
+
+            entities_by_type[type_name] = sorted(owned, key=lambda e: e.index)
+
+        return owners
+
+    @classmethod
+    def _link_references(cls, entities_by_type, lookups, owners=None):
+        """
+        Links each entity with the entities it references
+        :param lookups: dict with a function finding the entity a reference id points to, by type
+        :param owners: the owned parts of every entity when the scenario is sharded
+        :return: dict with the reference count of every referenced id by type, dict with the id every
+                 (type, reference id) points to, dict with the id every (type, reference id) created by another
+                 shard points to
+        """
+        reference_counts = {}
+        reference_targets = {}
+        external_references = {}
+
+        for entities in entities_by_type.values():
+            for entity in entities:
+                refs = [ref for _, ref in entity.references]
+                refs.extend(ref for _, _, ref in entity.special_methods if ref)
+
+                for ref in refs:
+                    target = lookups[ref.type_name](ref.id) if ref.type_name in lookups else None
+                    if target is None:
+                        continue
+
+                    identifier = int(ref.id) if target.count > 1 else target.identifier
+
+                    if owners is not None:
+                        target = cls._owned_part(owners, target, identifier)
+                        if target is None:
+                            external_references[(ref.type_name, ref.id)] = identifier
+                            continue
+
+                    counts = reference_counts.setdefault(ref.type_name, {})
+                    # Every object of a group of default definitions resolves the reference
+                    counts[identifier] = counts.get(identifier, 0) + entity.count
+                    reference_targets[(ref.type_name, ref.id)] = identifier
+
+                    if target not in entity.dependencies:
+                        entity.dependencies.append(target)
+
+        return reference_counts, reference_targets, external_references
+
+    @staticmethod
+    def _owned_part(owners, entity, identifier):
+        for part in owners.get(entity, ()):
+            if part.identifier == identifier or part.identifier <= identifier < part.identifier + part.count:
+                return part
+
+        return None
+
+    @classmethod
+    def _assign_sequential_identifiers(cls, type_name, entities):
+        aliases = {}
+        starts = []
+
+        for entity in entities:
+            entity.identifier = entity.position = entity.store_id = entity.index + 1
+            starts.append(entity.identifier)
+
+            if entity.alias:
+                if entity.alias in aliases:
+                    raise ScenariousException("Error loading type '{}'. Detail: Duplicated alias for {}"
+                                              .format(type_name, type_name))
+                aliases[entity.alias] = entity
+
+        def lookup(ref_id):
+            if ref_id in aliases:
+                return aliases[ref_id]
+
+            try:
+                identifier = int(ref_id)
+            except (TypeError, ValueError):
+                return None
+
+            i = bisect.bisect_right(starts, identifier) - 1
+            if i >= 0 and identifier < entities[i].identifier + entities[i].count:
+                return entities[i]
+
+            return None
+
+        return lookup
+
+    @classmethod
+    def _sort_types(cls, scenario, type_dependencies):
+        """
+        Sorts types so dependencies come first. Among the types that are ready to be loaded,
+        the ones in the load priority (or needed by one in the load priority) go first and then
+        the rest in definition order.
+        """
+        priority = [scenario._get_type_name(t) for t in scenario._load_priority]
+        keys = {}
+        for index, type_name in enumerate(type_dependencies):
+            keys[type_name] = (0, priority.index(type_name)) if type_name in priority else (1, index)
+
+        # A type needed by another one inherits its priority
+        effective_keys = dict(keys)
+        for type_name in type_dependencies:
+            pending = list(type_dependencies[type_name])
+            visited = set()
+            while pending:
+                dep = pending.pop()
+                if dep in visited:
+                    continue
+
+                visited.add(dep)
+                effective_keys[dep] = min(effective_keys[dep], keys[type_name])
+                pending.extend(type_dependencies[dep])
+
+        remaining = dict((t, set(deps)) for t, deps in type_dependencies.items())
+        order = []
+
+        while remaining:
+            ready = [t for t, deps in remaining.items() if not deps]
+            # On circular dependencies between types the entity level order will sort things out
+            candidates = ready or list(remaining)
+            next_type = min(candidates, key=lambda t: effective_keys[t])
+
+            order.append(next_type)
+            remaining.pop(next_type)
+            for deps in remaining.values():
+                deps.discard(next_type)
+
+        return order
+
+    @classmethod
+    def _sort_entities(cls, entities_by_type, type_order):
+        rank = dict((t, i) for i, t in enumerate(type_order))
+        dependents = {}
+        pending_deps = {}
+        heap = []
+
+        for type_name, entities in entities_by_type.items():
+            previous = None
+            for entity in entities:
+                # Entities of the same type keep their definition order, so ids are the expected ones
+                deps = set(entity.dependencies)
+                if previous is not None:
+                    deps.add(previous)
+
+                deps.discard(entity)
+                pending_deps[entity] = len(deps)
+                for dep in deps:
+                    dependents.setdefault(dep, []).append(entity)
+
+                if not deps:
+                    heapq.heappush(heap, (rank[type_name], entity.index, entity))
+
+                previous = entity
+
+        order = []
+        while heap:
+            _, _, entity = heapq.heappop(heap)
+            order.append(entity)
+
+            for dependent in dependents.get(entity, []):
+                pending_deps[dependent] -= 1
+                if not pending_deps[dependent]:
+                    heapq.heappush(heap, (rank[dependent.type_name], dependent.index, dependent))
+
+        if len(order) != len(pending_deps):
+            blocked = [e for e, count in pending_deps.items() if count]
+            raise ScenariousException(
+                "Circular reference between entities: {}".format(', '.join(repr(e) for e in blocked[:10])))
+
+        return order
@@ -1,12 +1,29 @@
 import six
+from operator import attrgetter
+from collections import namedtuple
 
 from .errors import BaseError
+from .util import LRUCache
 
 
 class ReferenceException(BaseError):
     pass
 
 
+class Reference(namedtuple('Reference', ['raw', 'type_name', 'id', 'attrs', 'is_alias', 'getter'])):
+    """
+    A compiled reference. The attribute chain is resolved with a precomputed attrgetter
+    """
+    __slots__ = ()
+
+    def resolve(self, obj):
+        return self.getter(obj) if self.getter else obj
+
+
+# Compiled references, shared by every scenario
+_references = LRUCache(max_size=65536)
+
+
 class ReferenceHandler(object):
 
     REFERENCE = '$'
@@ -16,7 +33,24 @@ class ReferenceHandler(object):
         return value.startswith(cls.REFERENCE) if isinstance(value, six.string_types) else False
 
     @classmethod
-    def parse(cls, ref):
+    def compile(cls, ref):
+        """
+        Compiles a reference string into a Reference. References are interned, so compiling
+        the same string again is just a lookup
+        :param ref: reference string, like $type_id.attr
+        :return: Reference
+        """
+        key = (cls, ref)
+        reference = _references.get(key)
+
+        if reference is None:
+            reference = cls._compile(ref)
+            _references.set(key, reference)
+
+        return reference
+
+    @classmethod
+    def _compile(cls, ref):
         try:
             ref_parts = ref.split('.')
             ref_key = ref_parts[0][1:]
@@ -25,9 +59,43 @@ class ReferenceHandler(object):
             ref_key_type = '_'.join(ref_key_parts[:-1])
             ref_key_id = ref_key_parts[-1]
 
-            ref_attrs = ref_parts[1:] if len(ref_parts) > 1 else []
+            ref_attrs = tuple(ref_parts[1:])
 
-            return ref_key_type, ref_key_id, ref_attrs
+            return Reference(ref, ref_key_type, ref_key_id, ref_attrs, not ref_key_id.isdigit(),
+                             attrgetter('.'.join(ref_attrs)) if ref_attrs else None)
 
         except Exception as e:
             ReferenceException.reraise("Invalid reference '{}'".format(ref), e)
+
+    @classmethod
+    def parse(cls, ref):
+        reference = cls.compile(ref)
+        return reference.type_name, reference.id, list(reference.attrs)
+
+    @classmethod
+    def find_references(cls, tree, skip_key=None, skipped=None):
+        """
+        Finds and compiles every reference in a definition tree (dicts and lists of them)
+        :param tree: definition to look references in
+        :param skip_key: function telling which dict keys should be left out
+        :param skipped: list where (path, value) of the skipped keys are added
+        :return: list of (path, Reference) where path is the chain of keys/indexes to reach the reference
+        """
+        references = []
+        cls._find_references(tree, (), skip_key, skipped, references)
+        return references
+
+    @classmethod
+    def _find_references(cls, tree, path, skip_key, skipped, references):
+        items = tree.items() if isinstance(tree, dict) else enumerate(tree)
+
+        for k, v in items:
+            if skip_key is not None and isinstance(tree, dict) and skip_key(k):
+                if skipped is not None:
+                    skipped.append((path + (k,), v))
+
+            elif isinstance(v, (dict, list, tuple)):
+                cls._find_references(v, path + (k,), skip_key, skipped, references)
+
+            elif cls.is_reference(v):
+                references.append((path + (k,), cls.compile(v)))
@@ -0,0 +1,182 @@
+import weakref
+from collections import namedtuple
+
+from .errors import BaseError
+from .type_handlers.base import TypeHandler
+
+
+class RetentionException(BaseError):
+    pass
+
+
+# Returned by a policy to leave an object out of the store
+DISCARD = object()
+
+
+class RetentionPolicy(object):
+    """
+    Decides what the EntityStore keeps for every object created in a scenario
+    """
+
+    name = None
+
+    # Whether stored values are the objects themselves, so there's nothing to load
+    transparent = True
+
+    def bind(self, scenario):
+        """
+        Called when the policy's store is used by a scenario
+        """
+        pass
+
+    def prepare(self, plan):
+        """
+        Called before a plan is executed
+        """
+        pass
+
+    def created(self, type_name, objects):
+        """
+        Called with every batch of objects created, before they're stored one by one
+        """
+        pass
+
+    def store(self, type_name, identifier, obj):
+        """
+        :return: the value to keep in the store for the object, or DISCARD
+        """
+        return obj
+
+    def load(self, type_name, identifier, value):
+        """
+        :return: the object for a value kept in the store
+        """
+        return value
+
+    def referenced(self, type_name, identifier):
+        """
+        Called every time a planned reference to the object is resolved
+        :return: whether the object can be dropped from the store
+        """
+        return False
+
+
+class FullRetention(RetentionPolicy):
+    """
+    Keeps every object for the whole life of the scenario
+    """
+
+    name = 'full'
+
+
+# A key kept in the store instead of its object
+Key = namedtuple('Key', ['value'])
+
+
+class KeysRetention(RetentionPolicy):
+    """
+    Keeps only the key of every object and loads it back through its type handler when accessed.
+    Objects of handlers that don't support loading by key are kept as they are
+    """
+
+    name = 'keys'
+    transparent = False
+
+    def __init__(self):
+        self._get_type_handler = None
+
+    def bind(self, scenario):
+        self._get_type_handler = scenario._get_type_handler
+
+    def _handler(self, type_name):
+        if self._get_type_handler is None:
+            raise RetentionException("'{}' retention needs to be used by a Scenario".format(self.name))
+
+        return self._get_type_handler(type_name)
+
+    @staticmethod
+    def _has_keys(handler):
+        return getattr(handler.get_key, '__func__', None) is not TypeHandler.get_key.__func__
+
+    def created(self, type_name, objects):
+        handler = self._handler(type_name)
+        if self._has_keys(handler):
+            handler.prepare_keys(objects)
+
+    def store(self, type_name, identifier, obj):
+        handler = self._handler(type_name)
+        if not self._has_keys(handler):
+            return obj
+
+        return Key(handler.get_key(obj))
+
+    def load(self, type_name, identifier, value):
+        return self._handler(type_name).load(value.value) if isinstance(value, Key) else value
+
+
+class WeakRetention(RetentionPolicy):
+    """
+    Keeps weak references, objects are available while something else holds them.
+    Objects that can't be weakly referenced are kept as they are
+    """
+
+    name = 'weak'
+    transparent = False
+
+    def store(self, type_name, identifier, obj):
+        try:
+            return weakref.ref(obj)
+        except TypeError:
+            return obj
+
+    def load(self, type_name, identifier, value):
+        return value() if isinstance(value, weakref.ref) else value
+
+
+class EvictAfterLastReference(RetentionPolicy):
+    """
+    Keeps objects only until the last reference to them in the scenario plan is resolved.
+    Objects nothing references are not kept at all
+    """
+
+    name = 'evict_after_last_reference'
+
+    def __init__(self):
+        self._remaining = {}
+
+    def prepare(self, plan):
+        self._remaining = dict((t, dict(counts)) for t, counts in plan.reference_counts.items())
+
+    def store(self, type_name, identifier, obj):
+        return obj if self._remaining.get(type_name, {}).get(identifier) else DISCARD
+
+    def referenced(self, type_name, identifier):
+        remaining = self._remaining.get(type_name, {})
+        if identifier not in remaining:
+            return False
+
+        remaining[identifier] -= 1
+        if remaining[identifier] > 0:
+            return False
+
+        remaining.pop(identifier)
+        return True
+
+
+RETENTION_POLICIES = dict((policy.name, policy) for policy in
+                          (FullRetention, KeysRetention, WeakRetention, EvictAfterLastReference))
+
+
+def get_retention_policy(retention=None):
+    """
+    :param retention: a RetentionPolicy or the name of one, full retention if not given
+    :return: RetentionPolicy
+    """
+    if isinstance(retention, RetentionPolicy):
+        return retention
+
+    try:
+        return RETENTION_POLICIES[retention or FullRetention.name]()
+    except KeyError:
+        raise RetentionException("Invalid retention policy '{}', expected one of: {}"
+                                 .format(retention, ', '.join(sorted(RETENTION_POLICIES))))
@@ -1,23 +1,39 @@
-import yaml
-import six
 import traceback
+from operator import attrgetter
 from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from collections import OrderedDict
 
-from .errors import BaseError
+from .errors import ScenariousException
+from .compiled import Link, artifact_key, write_artifact, read_artifact, find_links, set_path
+from .plan import ScenarioPlan, DefaultDefinitions
+from .lazy import LazyEntities
+from .pipeline import init_worker, prepare_chunks
+from .seeding import entity_seed
+from .sharding import Shard, ExternalEntity
+from .stats import BuildStats, SCENARIO
 from .reference_handler import ReferenceHandler
-from .store_handler import EntityStore
+from .retention import get_retention_policy, DISCARD
+from .source_cache import default_source_cache, source_digest, copy_definition
+from .store_handler import EntityStore, EntityID
 from .type_handlers.base import TypeHandlerException
 
 
-class ScenariousException(BaseError):
-    pass
+class Scenario(object):
 
+    source_cache = default_source_cache
 
-class Scenario(object):
+    # Number of objects handed over to the type handler at once when creating default definitions
+    chunk_size = 1000
+
+    # Number of chunks worker processes can generate ahead of the writer in pipeline mode
+    pipeline_depth = 16
 
     @classmethod
-    def load(cls, source, type_handlers, load_priority=None, reference_handler=None, entity_store=None, autobuild=True):
+    def load(cls, source, type_handlers, load_priority=None, reference_handler=None, entity_store=None, autobuild=True,
+             workers=None, streaming=False, retention=None, processes=None, seed=None, shard=None, stats=False,
+             lazy=False):
         """
         Builds the Scenario based on the scenario definition stored in source, using the provided type handlers
         :param source: A config file path or config file object to load the scenario from or a dict already built
@@ -25,6 +41,18 @@ class Scenario(object):
         :param load_priority: A list of type_names to be loaded first
         :param reference_handler: A reference parser
         :param entity_store: An entity store that handles object mapping and retrieval
+        :param workers: Number of threads used to create independent entities concurrently, serial if not given
+        :param processes: Number of worker processes generating the data of default definitions (pipeline mode)
+        :param seed: Makes generated data reproducible, every object is generated with a seed derived from
+                     this one, its type and its id, no matter the order or the process it's created in
+        :param shard: Builds only a slice of the scenario: a Shard, (shard index, shard count) or a dict with
+                      the (first, last) ids to build by type name
+        :param streaming: Only keep the objects referenced by other entities, to build huge scenarios in bounded memory
+        :param retention: RetentionPolicy, or its name, deciding what the entity store keeps for every object:
+                          'full' (default), 'keys', 'weak' or 'evict_after_last_reference'
+        :param stats: Records timings and counters by type and phase in scenario.build_stats. True or a BuildStats
+        :param lazy: Building only plans the scenario, objects are created when accessed along with everything
+                     they reference. materialize_all creates the rest
         :return: A Scenario
         """
 
@@ -34,39 +62,340 @@ class Scenario(object):
             type_handlers_by_name.update({name: th for name in names})
 
         reference_handler = reference_handler or ReferenceHandler()
-        entity_store = entity_store or EntityStore()
+        if entity_store is None:
+            entity_store = EntityStore(retention=retention)
+        elif retention is not None:
+            entity_store.retention = get_retention_policy(retention)
 
         return cls(source, type_handlers_by_name, reference_handler=reference_handler, entity_store=entity_store,
-                   load_priority=load_priority, autobuild=autobuild)
-
-    def __init__(self, source, handlers_by_type_name, reference_handler, entity_store, load_priority=None, autobuild=True):
+                   load_priority=load_priority, autobuild=autobuild, workers=workers, streaming=streaming,
+                   processes=processes, seed=seed, shard=shard, stats=stats, lazy=lazy)
+
+    def __init__(self, source, handlers_by_type_name, reference_handler, entity_store, load_priority=None, autobuild=True,
+                 workers=None, streaming=False, processes=None, seed=None, shard=None, stats=False, lazy=False):
+        self._lazy = lazy
+        # Objects of a lazy scenario already created, by (type name, id), and groups of default definitions
+        # created at once, by (type name, index)
+        self._created = set()
+        self._created_groups = set()
+        # Types of a lazy scenario with every object created
+        self._complete_types = set()
         self._raw_data = {}
+        # Digest of every source's content, or the dict itself until an artifact key is needed
+        self._sources = []
+        self._plan = None
+        # Data loaded from a compiled artifact, built instead of the plan
+        self._artifact = None
+        # Number of definitions already created, by type, so builds after an update only create what was added
+        self._materialized = {}
         self._type_handlers = handlers_by_type_name
         self._ref_handler = reference_handler
         self._entity_store = entity_store
         self._load_priority = load_priority or []
+        self._workers = workers
+        self._processes = processes
+        self._seed = seed
+        self._shard = Shard.parse(shard)
+        self._streaming = streaming
+        # None when disabled, so nothing is measured
+        self.build_stats = (stats if isinstance(stats, BuildStats) else BuildStats()) if stats else None
+        self._entity_store.retention.bind(self)
         self.update(source)
 
         if autobuild:
             self.build()
 
     def update(self, source):
+        """
+        Adds the definitions of another source to the scenario. When the scenario was already built,
+        building it again only creates the new entities, references to the existing ones still work.
+        :param source: A config file path or config file object to load the scenario from or a dict already built
+        """
         if isinstance(source, dict):
             raw = source
+            if raw:
+                self._sources.append(raw)
         else:
-            raw = yaml.full_load(open(source) if isinstance(source, six.string_types) else source)
+            with self._measuring('parse'):
+                raw, digest = self.source_cache.load_with_digest(source)
+                self._sources.append(digest)
 
         for entity, value in (raw or {}).items():
-            objects = [{}] * value if isinstance(value, int) else value
+            objects = [DefaultDefinitions(value)] if isinstance(value, int) else value
             self._raw_data[entity] = self._raw_data.get(entity, []) + objects
 
-    def build(self):
-        for _type in self._load_priority:
-            self._load_type_definition(self._get_type_name(_type))
+        self._plan = None
+        self._artifact = None
+        self._complete_types.clear()
+
+    def compile(self):
+        """
+        Compiles the raw definitions into a ScenarioPlan. The plan is cached until the scenario is updated,
+        so building the same scenario again doesn't need to parse definitions or look for references.
+        :return: A ScenarioPlan
+        """
+        if self._plan is None:
+            with self._measuring('compile'):
+                self._plan = ScenarioPlan.compile(self)
 
-        for _type, type_def in iter(self._raw_data.items()):
-            if _type not in self._load_priority:
-                self._load_type_definition(self._get_type_name(_type), type_def)
+        return self._plan
+
+    def build(self, workers=None, executor=None, processes=None, pool=None):
+        """
+        Creates every object of the scenario
+        :param workers: Number of threads used to create independent entities concurrently
+        :param executor: An executor to create independent entities concurrently on, instead of creating threads
+        :param processes: Number of worker processes generating the data of default definitions. Objects are
+                          still created by the handler in this process, as soon as each chunk is ready
+        :param pool: A process pool to generate the data of default definitions on, instead of creating one
+        """
+        if self._lazy:
+            # Objects are created as they are accessed
+            self.compile()
+            return
+
+        workers = workers or self._workers
+        if executor is None and workers:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return self.build(executor=executor, processes=processes, pool=pool)
+
+        processes = processes or self._processes
+        if pool is None and processes:
+            with ProcessPoolExecutor(max_workers=processes, initializer=init_worker) as pool:
+                return self.build(executor=executor, pool=pool)
+
+        plan = self.compile()
+
+        with self._measuring('build'), self._building(plan):
+            if self._artifact is not None:
+                self._replay(self._artifact)
+            else:
+                materialized = plan.materialized(self)
+                plan.execute(self, executor=executor, pool=pool)
+                self._materialized.update(materialized)
+
+    async def abuild(self, concurrency=None):
+        """
+        Creates every object of the scenario using the handlers' async creation. Entities are
+        created as soon as everything they reference exists.
+        :param concurrency: Maximum number of entities being created at the same time
+        """
+        if self._artifact is not None:
+            raise ScenariousException("Scenarios loaded from a compiled artifact are created with build")
+
+        if self._lazy:
+            self.compile()
+            return
+
+        plan = self.compile()
+
+        with self._measuring('build'), self._building(plan):
+            materialized = plan.materialized(self)
+            await plan.aexecute(self, concurrency=concurrency)
+            self._materialized.update(materialized)
+
+    @classmethod
+    def load_compiled(cls, path, source, type_handlers, **kwargs):
+        """
+        Builds the Scenario out of the artifact at path, without parsing the source or generating any data.
+        When there's no artifact yet, or the source or the type handlers changed since it was compiled, the
+        source is compiled to path first.
+        :param path: path of the artifact
+        :param source: A config file path or config file object to load the scenario from or a dict already built
+        :param type_handlers: A list of handlers for every supported type
+        :param kwargs: any other argument of load, like seed or shard
+        :return: A Scenario
+        """
+        autobuild = kwargs.pop('autobuild', True)
+        digest, source = source_digest(source)
+        scenario = cls.load({}, type_handlers, autobuild=False, **kwargs)
+
+        artifact = read_artifact(path, scenario._artifact_key([digest]))
+        if artifact is None:
+            scenario.update(source)
+            artifact = scenario.compile_to(path)
+
+        # The plan of the artifact only tells the build hooks, retention and streaming what to expect
+        scenario._plan = ScenarioPlan([], artifact['type_order'], OrderedDict(), artifact['reference_counts'],
+                                      artifact['reference_targets'])
+        scenario._artifact = artifact
+
+        if autobuild:
+            scenario.build()
+
+        return scenario
+
+    def compile_to(self, path):
+        """
+        Writes the fully resolved data of every object of the scenario to an artifact, so it can be loaded
+        with load_compiled: generated values and parsed dates are frozen and references are kept as links
+        to the entity they point to. No object is created.
+        :param path: path of the artifact
+        :return: the artifact
+        """
+        plan = self.compile()
+        records = []
+
+        with self._measuring('compile_to'):
+            for entity in plan:
+                with self._loading(entity.type_name):
+                    records.append(self._compile_entity(self._get_type_handler(entity.type_name), entity))
+
+        artifact = {
+            'type_order': plan.type_order,
+            'reference_counts': plan.reference_counts,
+            'reference_targets': plan.reference_targets,
+            'records': records,
+        }
+        write_artifact(path, self._artifact_key(), artifact)
+
+        return artifact
+
+    def _compile_entity(self, handler, entity):
+        """
+        :return: (type name, first id, alias, data of every object, links of every object, special methods)
+        """
+        data_list = []
+        for start in range(0, entity.count, self.chunk_size):
+            size = min(self.chunk_size, entity.count - start)
+            data_list.extend(handler.prepare_many(
+                self._group_definitions(entity, start, size, self._link),
+                self._group_seeds(entity, start, size) if self._seed is not None else None))
+
+        methods = [('_' + method.__name__, param, ref is not None, self._link(ref) if ref else None)
+                   for method, param, ref in entity.special_methods]
+
+        return (entity.type_name, entity.identifier, entity.alias, data_list, [find_links(d) for d in data_list],
+                methods)
+
+    def _external_entity(self, type_name, identifier):
+        return ExternalEntity(type_name, identifier, self._get_type_handler(type_name).get_key_attribute())
+
+    def _link(self, ref):
+        """
+        Stands for a planned reference in an artifact
+        """
+        external = self._plan.external_references.get((ref.type_name, ref.id))
+        if external is not None:
+            return ref.resolve(self._external_entity(ref.type_name, external))
+
+        identifier = self._plan.reference_targets.get((ref.type_name, ref.id))
+        if identifier is None:
+            raise ScenariousException("Reference error, '{}' can't be compiled, it doesn't point to an entity of "
+                                      "the scenario".format(ref.raw))
+
+        return Link(ref.type_name, identifier, ref.attrs)
+
+    def _artifact_key(self, source_digests=None):
+        if source_digests is None:
+            source_digests = [s if isinstance(s, str) else source_digest(s)[0] for s in self._sources]
+
+        return artifact_key(source_digests, self._type_handlers.values(), self._seed, self._shard)
+
+    def _replay(self, artifact):
+        """
+        Creates every object of an artifact straight through the handlers, in the order they were planned
+        """
+        for type_name, identifier, alias, data_list, links, methods in artifact['records']:
+            with self._loading(type_name):
+                handler = self._get_type_handler(type_name)
+                # The artifact's data is left untouched, so it can be built again
+                data_list = [copy_definition(data) for data in data_list]
+
+                for data, data_links in zip(data_list, links):
+                    for path, link in data_links:
+                        set_path(data, path, self._get_link(link))
+
+                stats = self._type_stats(type_name)
+                new_objs = self._create_prepared(handler, data_list, stats)
+                self._entity_store.retention.created(type_name, new_objs)
+
+                special_methods = [(handler.get_special_method(name), param, value if has_ref else None)
+                                   for name, param, has_ref, value in methods]
+
+                for i, new_obj in enumerate(new_objs):
+                    # Only records of many default definitions have consecutive ids, others might be strings
+                    object_id = identifier + i if len(new_objs) > 1 else identifier
+                    self._store_entity(type_name, new_obj, object_id, alias if not i else None)
+                    self._apply_special_methods(new_obj, special_methods, self._get_link)
+
+    def _get_link(self, link):
+        if not isinstance(link, Link):
+            # Already resolved when compiling, like references to other shards
+            return link
+
+        value = self._entity_store.get(link.type_name, link.identifier)
+        if link.attrs and value is not None:
+            self._get_type_handler(link.type_name).on_reference(value, link.attrs)
+
+        self._entity_store.referenced(link.type_name, link.identifier)
+
+        return attrgetter('.'.join(link.attrs))(value) if link.attrs else value
+
+    def _measuring(self, phase):
+        """
+        Measures a phase of the scenario itself, when stats are enabled
+        """
+        return self.build_stats.measure(SCENARIO, phase) if self.build_stats is not None else _not_measured()
+
+    def _type_stats(self, type_name):
+        return self.build_stats.for_type(type_name) if self.build_stats is not None else None
+
+    @contextmanager
+    def _building(self, plan):
+        """
+        Notifies the type handlers involved in the plan that a build starts and ends
+        """
+        handlers = []
+        for type_name in plan.type_order:
+            handler = self._get_type_handler(type_name)
+            if handler not in handlers:
+                handlers.append(handler)
+
+        self._entity_store.retention.prepare(plan)
+
+        # Only the handlers whose build began are notified that it ended
+        begun = []
+
+        try:
+            for handler in handlers:
+                handler.begin_build()
+                begun.append(handler)
+
+            yield
+
+        except Exception as e:
+            for handler in begun:
+                handler.end_build(error=e)
+            raise
+
+        for handler in begun:
+            handler.end_build()
+
+    def reset(self):
+        """
+        Drops every object created so far, so the scenario can be built again
+        """
+        self._entity_store.reset()
+        self._materialized.clear()
+        self._created.clear()
+        self._created_groups.clear()
+        self._complete_types.clear()
+
+    def retain(self, retention):
+        """
+        Changes what the entity store keeps for every object created so far and from now on
+        :param retention: RetentionPolicy, or its name
+        """
+        store = self._entity_store.__class__(retention=retention)
+        store.retention.bind(self)
+
+        for type_name, entity_id, obj in self._entity_store.entities():
+            value = store.retention.store(type_name, entity_id.identifier, obj)
+            if value is not DISCARD:
+                store.restore(value, type_name, entity_id)
+
+        self._entity_store = store
 
     def __getattr__(self, key):
         """
@@ -84,6 +413,10 @@ class Scenario(object):
         """
         if key.startswith('add_'):
             type_name = key.replace('add_', '')
+            if self._is_lazy_type(self._get_type_name(type_name)):
+                # New objects must not take the ids of the planned ones
+                self._materialize_type(self._get_type_name(type_name))
+
             if self._entity_store.has_type(self._get_type_name(type_name)):
                 return partial(self._create_obj, type_name)
 
@@ -93,12 +426,120 @@ class Scenario(object):
         else:
             type_name = self._get_type_name(key)
 
+            if self._is_lazy_type(type_name):
+                return LazyEntities(self, type_name)
+
             if self._entity_store.has_type(type_name):
                 return self._entity_store.all(type_name)
 
             else:
                 raise AttributeError("%s doesn't have type '%s'" % (self.__class__.__name__, type_name))
 
+    def materialize_all(self):
+        """
+        Creates every object of a lazy scenario that wasn't created yet
+        """
+        for type_name in self.compile().type_order:
+            self._materialize_type(type_name)
+
+    def _is_lazy_type(self, type_name):
+        return self._lazy and type_name not in self._complete_types and bool(self.compile().entities_of(type_name))
+
+    def _materialize_ref(self, type_name, ref_id):
+        target = self.compile().find(type_name, ref_id)
+        if target is not None:
+            self._materialize([target])
+
+    def _materialize_at(self, type_name, position):
+        """
+        :return: the id of the object created at a position of its type, None if there's no such planned object
+        """
+        target = self.compile().at(type_name, position)
+        if target is None:
+            return None
+
+        self._materialize([target])
+        return target[1]
+
+    def _materialize_type(self, type_name):
+        if type_name in self._complete_types:
+            return
+
+        plan = self.compile()
+        targets = []
+
+        for entity in plan.entities_of(type_name):
+            if entity.count > 1 and not any((type_name, i) in self._created for i in entity.identifiers()):
+                # None of the group was accessed, so it's created at once
+                targets.append((entity, None))
+            else:
+                targets.extend((entity, i) for i in entity.identifiers())
+
+        self._materialize(targets)
+        plan._restore_order(self, plan.entities_of(type_name))
+        self._complete_types.add(type_name)
+
+    def _materialize(self, targets):
+        """
+        Creates planned objects of a lazy scenario that weren't created yet, and everything they reference
+        :param targets: list of (PlannedEntity, id of the object), with a None id for a whole group of
+                        default definitions
+        """
+        plan = self.compile()
+        pending = self._pending_objects(plan, targets)
+        if not pending:
+            return
+
+        parts = [entity if identifier is None or entity.count == 1 else entity.slice(identifier - entity.identifier, 1)
+                 for entity, identifier in pending]
+
+        try:
+            with self._measuring('build'), self._building(plan):
+                for batch in plan.batches(parts):
+                    self._load_entities(batch, predicted_ids=True)
+
+        except Exception:
+            for entity, identifier in pending:
+                self._created.discard((entity.type_name, identifier))
+                self._created_groups.discard((entity.type_name, entity.index))
+            raise
+
+    def _pending_objects(self, plan, targets):
+        """
+        :return: list of (PlannedEntity, id) not created yet out of the targets and what they reference,
+                 referenced objects first
+        """
+        pending = []
+        stack = [(target, False) for target in reversed(targets)]
+
+        while stack:
+            (entity, identifier), expanded = stack.pop()
+            if expanded:
+                pending.append((entity, identifier))
+                continue
+
+            if (entity.type_name, entity.index) in self._created_groups:
+                continue
+
+            if identifier is None:
+                self._created_groups.add((entity.type_name, entity.index))
+            elif (entity.type_name, identifier) in self._created:
+                continue
+            else:
+                self._created.add((entity.type_name, identifier))
+
+            stack.append(((entity, identifier), True))
+
+            refs = [ref for _, ref in entity.references]
+            refs.extend(ref for _, _, ref in entity.special_methods if ref)
+
+            for ref in reversed(refs):
+                target = plan.find(ref.type_name, ref.id)
+                if target is not None:
+                    stack.append((target, False))
+
+        return pending
+
     def _get_type_name(self, name):
         return name.rstrip('s')
 
@@ -133,59 +574,203 @@ class Scenario(object):
         :param ref:
         :return: the resolved reference
         """
-        ref_key_type, ref_key_id, ref_attrs = self._ref_handler.parse(ref)
+        return self._get_reference(self._ref_handler.compile(ref))
+
+    def _get_reference(self, ref):
+        """
+        Gets the value of a compiled reference
+        :param ref: Reference
+        :return: the resolved reference
+        """
+        if not self._entity_store.has_type(ref.type_name):
+            raise ScenariousException("Reference error, couldn't find type '{}'".format(ref.type_name))
 
-        # We might have not loaded a needed dependency yet, so try to load it first
-        if not self._entity_store.has_type(ref_key_type):
-            try:
-                self._load_type_definition(ref_key_type)
-            except Exception as e:
-                ScenariousException.reraise("Reference error, couldn't find type '{}'".format(ref_key_type), e)
+        value = self._entity_store.get(ref.type_name, ref.id)
+        if ref.attrs and value is not None:
+            self._get_type_handler(ref.type_name).on_reference(value, ref.attrs)
 
-        value = self._entity_store.get(ref_key_type, ref_key_id)
-        for attr in ref_attrs:
-            value = getattr(value, attr)
+        return ref.resolve(value)
+
+    def _get_planned_reference(self, ref):
+        """
+        Gets the value of a reference found while compiling the plan, letting the store know it was used
+        :param ref: Reference
+        :return: the resolved reference
+        """
+        stats = self._type_stats(ref.type_name)
+        started = stats.start() if stats is not None else None
+
+        external = self._plan.external_references.get((ref.type_name, ref.id))
+        if external is not None:
+            # Created by another shard, only its id is known
+            value = ref.resolve(self._external_entity(ref.type_name, external))
+
+        else:
+            value = self._get_reference(ref)
+
+            identifier = self._plan.reference_targets.get((ref.type_name, ref.id))
+            if identifier is not None:
+                self._entity_store.referenced(ref.type_name, identifier)
+
+        if stats is not None:
+            stats.lap('resolve', started, 1)
 
         return value
 
-    def _load_type_definition(self, type_name, type_def=None):
-        type_def = type_def or self._raw_data.get(type_name, self._raw_data[type_name+"s"])
+    def _load_entities(self, entities, predicted_ids=False, pool=None):
+        """
+        Creates planned entities of a single type at once, all their dependencies must be loaded already
+        :param entities: list of PlannedEntity to create
+        :param predicted_ids: whether to store objects with the ids predicted by the plan
+        :param pool: process pool to generate the data of default definitions on
+        """
+        type_name = entities[0].type_name
+        # Objects might not end up in the store when streaming and sharded scenarios don't start from the first
+        # object, so the store can't generate ids
+        predicted_ids = predicted_ids or self._streaming or self._shard is not None
 
-        if not self._entity_store.has_type(type_name):
-            if type(type_def) is list:
-                for data in type_def:
-                    self._load_type(type_name, data)
+        with self._loading(type_name):
+            handler = self._get_type_handler(type_name)
 
-            elif type(type_def) is dict:
-                self._load_type(type_name, type_def)
+            if entities[0].count > 1:
+                self._load_default_entities(handler, entities[0], pool)
 
-            elif type(type_def) is int:
-                for _ in range(type_def):
-                    self._load_type(type_name, {})
             else:
-                raise ScenariousException(
-                    "Type definition '{}' must be a list, dict or int. Got '{}' instead"
-                        .format(type_name, type(type_def)))
+                new_objs = handler.create_many([self._resolve(entity, entity.identifier) for entity in entities],
+                                               self._entity_seeds(entities), self._type_stats(type_name))
+                self._entity_store.retention.created(type_name, new_objs)
 
-    def _load_type(self, type_name, type_def):
-        try:
-            special_methods = []
-            new_obj = self._create_obj(type_name, type_def, special_methods=special_methods)
+                for entity, new_obj in zip(entities, new_objs):
+                    self._add_entity(entity, new_obj, entity.identifier if predicted_ids else entity.store_id)
+
+    def _load_default_entities(self, handler, entity, pool=None):
+        """
+        Creates the objects of a planned entity covering many default definitions, in chunks.
+        With a process pool the data of the chunks is generated by the workers, while this process creates them.
+        """
+        get_seeds = partial(self._group_seeds, entity) if self._seed is not None else None
+        stats = self._type_stats(entity.type_name)
+
+        if pool is None:
+            chunks = self._create_chunks(handler, entity, get_seeds, stats)
+
+        else:
+            # Data is prepared by the worker processes, only the creation is measured here
+            chunks = ((start, self._create_prepared(handler, data, stats)) for start, data in prepare_chunks(
+                pool, handler, partial(self._group_definitions, entity), entity.count,
+                self.chunk_size, self.pipeline_depth, get_seeds))
+
+        for start, new_objs in chunks:
+            self._entity_store.retention.created(entity.type_name, new_objs)
+
+            # Ids were assigned by range when planning, so no need to ask the store
+            for i, new_obj in enumerate(new_objs):
+                self._add_entity(entity, new_obj, entity.identifier + start + i)
+
+    def _create_chunks(self, handler, entity, get_seeds=None, stats=None):
+        for start in range(0, entity.count, self.chunk_size):
+            size = min(self.chunk_size, entity.count - start)
+            yield start, handler.create_many(self._group_definitions(entity, start, size),
+                                             get_seeds(start, size) if get_seeds else None, stats)
 
-            # Apply all special methods to the new object
-            for method, param in special_methods:
-                params = [new_obj]
+    @staticmethod
+    def _create_prepared(handler, data_list, stats=None):
+        if stats is None:
+            return handler._do_create_many(data_list)
 
-                if isinstance(param, six.string_types):
-                    params.append(self._resolve_reference(param) if self._ref_handler.is_reference(param) else param)
+        with stats.measure('create', len(data_list)):
+            return handler._do_create_many(data_list)
 
-                elif type(param) in (list, tuple):
-                    params.extend(param)
+    def _group_definitions(self, entity, start, size, get_reference=None):
+        return [self._resolve(entity, entity.identifier_at(start + i), get_reference) for i in range(size)]
+
+    def _resolve(self, entity, identifier, get_reference=None):
+        """
+        Builds the definition of an object of a planned entity with every reference resolved
+        :param get_reference: function resolving every reference, the referenced objects by default
+        """
+        definition = entity.resolve(get_reference or self._get_planned_reference)
+
+        if self._shard is not None and self._shard.assign_ids:
+            # Shards create objects with their planned id, so they don't collide with other shards' objects
+            key_attribute = self._get_type_handler(entity.type_name).get_key_attribute()
+            if key_attribute is not None:
+                definition.setdefault(key_attribute, identifier)
+
+        return definition
+
+    async def _aload_entity(self, entity):
+        """
+        Creates a planned entity with the handler's async creation, all its dependencies must be loaded already
+        :param entity: PlannedEntity to create
+        """
+        with self._loading(entity.type_name):
+            handler = self._get_type_handler(entity.type_name)
+            stats = self._type_stats(entity.type_name)
+
+            for identifier in entity.identifiers():
+                if self._seed is None and stats is None:
+                    new_obj = await handler.acreate(**self._resolve(entity, identifier))
 
                 else:
-                    params.append(param)
+                    seeds = [entity_seed(self._seed, entity.type_name, identifier)] if self._seed is not None else None
+                    data = handler.prepare_many([self._resolve(entity, identifier)], seeds, stats)
+
+                    # Wall time includes whatever else the event loop ran while waiting
+                    started = stats.start() if stats is not None else None
+                    new_obj = await handler._ado_create(data[0])
+                    if stats is not None:
+                        stats.lap('create', started, 1)
+
+                self._add_entity(entity, new_obj, identifier)
+
+    def _entity_seeds(self, entities):
+        """
+        :return: the seeds to generate the data of single planned entities with, None if the scenario isn't seeded
+        """
+        if self._seed is None:
+            return None
+
+        return [entity_seed(self._seed, entity.type_name, entity.identifier) for entity in entities]
+
+    def _group_seeds(self, entity, start, size):
+        """
+        :return: the seeds to generate the data of a chunk of a planned entity covering many default definitions
+        """
+        return [entity_seed(self._seed, entity.type_name, entity.identifier_at(start + i)) for i in range(size)]
+
+    def _add_entity(self, entity, new_obj, identifier):
+        self._store_entity(entity.type_name, new_obj, identifier, entity.alias)
+        self._apply_special_methods(new_obj, entity.special_methods, self._get_planned_reference)
+
+    def _store_entity(self, type_name, new_obj, identifier, alias=None):
+        if not self._streaming or identifier in self._plan.reference_counts.get(type_name, ()):
+            self._entity_store.add(new_obj, type_name=type_name, entity_id=EntityID(identifier, alias))
+
+    def _apply_special_methods(self, new_obj, special_methods, get_reference):
+        """
+        Applies every special method to a new object
+        :param special_methods: list of (method, param, reference or None)
+        """
+        for method, param, ref in special_methods:
+            params = [new_obj]
+
+            if ref is not None:
+                params.append(get_reference(ref))
+
+            elif type(param) in (list, tuple):
+                params.extend(param)
+
+            else:
+                params.append(param)
+
+            method(*params)
+
+    @contextmanager
+    def _loading(self, type_name):
+        try:
+            yield
 
-                method(*params)
         except (TypeHandlerException, ScenariousException):
             raise
 
@@ -219,7 +804,15 @@ class Scenario(object):
 
     def by_id(self, type_name, ref_id):
         type_name = self._get_type_name(type_name)
+        if self._lazy:
+            self._materialize_ref(type_name, ref_id)
+
         if not self._entity_store.has_type(type_name):
             raise KeyError("{} doesn't have elements of type '{}'".format(self.__class__.__name__, type_name))
 
         return self._entity_store.get(type_name, ref_id)
+
+
+@contextmanager
+def _not_measured():
+    yield
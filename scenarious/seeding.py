@@ -0,0 +1,55 @@
+import random
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import numpy
+
+except ImportError:
+    numpy = None
+
+
+# Seeding swaps the state of global generators, so only one object can be generated at a time
+_lock = threading.RLock()
+
+
+def entity_seed(seed, type_name, identifier):
+    """
+    Derives the seed of a single entity, so its data doesn't depend on when or where it is generated
+    :param seed: seed of the scenario
+    :param type_name: type of the entity
+    :param identifier: id of the entity
+    :return: int
+    """
+    key = '{}:{}:{}'.format(seed, type_name, identifier).encode('utf-8')
+    return int(hashlib.sha256(key).hexdigest()[:16], 16)
+
+
+@contextmanager
+def seeded(seed):
+    """
+    Seeds faker, random and numpy (if installed) while generating data, restoring their previous state afterwards
+    :param seed: int
+    """
+    from .type_handlers.base import faker
+
+    with _lock:
+        fake_random = faker.random
+        states = [(fake_random, fake_random.getstate()), (random, random.getstate())]
+        numpy_state = numpy.random.get_state() if numpy is not None else None
+
+        fake_random.seed(seed)
+        random.seed(seed)
+        if numpy is not None:
+            numpy.random.seed(seed % 2 ** 32)
+
+        try:
+            yield
+
+        finally:
+            for generator, state in reversed(states):
+                generator.setstate(state)
+
+            if numpy is not None:
+                numpy.random.set_state(numpy_state)
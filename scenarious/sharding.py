@@ -0,0 +1,99 @@
+from .errors import ScenariousException
+
+
+class Shard(object):
+    """
+    A slice of a scenario, so many processes or machines can each build a part of the same logical scenario.
+
+    Every shard plans the whole scenario, so every entity gets the same id in every shard, and then only
+    creates the entities it owns: by default the index-th of count contiguous blocks of every type, or the
+    entities within the explicit id ranges given for a type.
+    """
+
+    def __init__(self, index=0, count=1, ranges=None, assign_ids=True):
+        """
+        :param index: index of this shard, from 0 to count - 1
+        :param count: number of shards the scenario is split in
+        :param ranges: dict with the (first, last) ids this shard owns by type name, for the types listed
+        :param assign_ids: whether objects are created with their id, so shards writing to the same
+                           database don't collide and references across shards point to the right rows
+        """
+        if count < 1 or not 0 <= index < count:
+            raise ScenariousException("Invalid shard {} of {}".format(index, count))
+
+        self.index = index
+        self.count = count
+        self.ranges = dict(ranges or {})
+        self.assign_ids = assign_ids
+
+    def __repr__(self):
+        return "<Shard {} of {}>".format(self.index, self.count)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        :param spec: a Shard, an (index, count) tuple or a dict of id ranges by type name
+        :return: Shard
+        """
+        if spec is None or isinstance(spec, Shard):
+            return spec
+
+        if isinstance(spec, dict):
+            return cls(ranges=spec)
+
+        if isinstance(spec, (list, tuple)) and len(spec) == 2:
+            return cls(*spec)
+
+        raise ScenariousException("Invalid shard '{}', expected a Shard, (index, count) or id ranges by type"
+                                  .format(spec))
+
+    def id_range(self, type_name):
+        """
+        :return: (first, last + 1) of the ids owned for the type, None if the type is split in blocks
+        """
+        first_last = self.ranges.get(type_name, self.ranges.get(type_name + 's'))
+        return (first_last[0], first_last[1] + 1) if first_last else None
+
+    def block(self, total):
+        """
+        :param total: number of objects of a type
+        :return: (start, end) positions of the block owned
+        """
+        return total * self.index // self.count, total * (self.index + 1) // self.count
+
+
+class ExternalEntity(object):
+    """
+    Stands for an entity created by another shard, references to it can only use its id,
+    as id or as the key attribute its handler assigns the id to
+    """
+
+    __slots__ = ('type_name', 'id', 'key_attribute')
+
+    def __init__(self, type_name, identifier, key_attribute='id'):
+        self.type_name = type_name
+        self.id = identifier
+        self.key_attribute = key_attribute
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == 'key_attribute':
+            # Lookups of pickle and copy protocols, stubs can be pickled into compiled artifacts
+            raise AttributeError(name)
+
+        if name == self.key_attribute:
+            return self.id
+
+        raise ScenariousException("{}_{} is created by another shard, only its id can be referenced"
+                                  .format(self.type_name, self.id))
+
+    def __eq__(self, other):
+        return isinstance(other, ExternalEntity) and (self.type_name, self.id) == (other.type_name, other.id)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.type_name, self.id))
+
+    def __repr__(self):
+        return "<ExternalEntity {}_{}>".format(self.type_name, self.id)
@@ -0,0 +1,113 @@
+import io
+import os
+import six
+import json
+import yaml
+import hashlib
+
+from .util import LRUCache
+
+try:
+    # libyaml bindings are way faster than the pure python loader
+    from yaml import CFullLoader as YamlLoader
+
+except ImportError:
+    from yaml import FullLoader as YamlLoader
+
+
+def copy_definition(value):
+    """
+    Copies the containers of a parsed definition. Scalars are immutable so they can be shared
+    """
+    if isinstance(value, dict):
+        return dict((k, copy_definition(v)) for k, v in value.items())
+
+    elif isinstance(value, list):
+        return [copy_definition(v) for v in value]
+
+    return value
+
+
+def content_digest(content):
+    return hashlib.sha1(content.encode('utf-8') if isinstance(content, six.text_type) else content).hexdigest()
+
+
+def source_digest(source):
+    """
+    Hashes the content of a source without parsing it
+    :param source: A config file path, a config file object or a dict already built
+    :return: (digest, source) where source is a fresh stream with the same content when a stream was given
+    """
+    if isinstance(source, dict):
+        return content_digest(json.dumps(source, sort_keys=True, default=repr)), source
+
+    if isinstance(source, six.string_types):
+        with open(source) as f:
+            return content_digest(f.read()), source
+
+    content = source.read()
+    return content_digest(content), io.StringIO(content) if isinstance(content, six.text_type) else io.BytesIO(content)
+
+
+class SourceCache(object):
+    """
+    Caches parsed scenario sources. Files are keyed by path and modification time, strings and streams
+    by a hash of their content. Every call returns a fresh copy of the parsed definition, since the
+    definitions get modified while building a scenario.
+    """
+
+    def __init__(self, max_size=128, loader=YamlLoader):
+        self.loader = loader
+        self._cache = LRUCache(max_size)
+        # Content digest of the cached files, streams are already keyed by it
+        self._digests = LRUCache(max_size)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+        self._digests.clear()
+
+    def load(self, source):
+        """
+        Parses a source
+        :param source: A config file path or a config file object
+        :return: the parsed definition
+        """
+        return self.load_with_digest(source)[0]
+
+    def load_with_digest(self, source):
+        """
+        Parses a source, also hashing its content
+        :param source: A config file path or a config file object
+        :return: (parsed definition, digest of the content), the digest matches the one of source_digest
+        """
+        if isinstance(source, six.string_types):
+            path = os.path.realpath(source)
+            stat = os.stat(path)
+            key = ('path', path, stat.st_mtime, stat.st_size)
+            content = None
+
+        else:
+            content = source.read()
+            key = ('content', content_digest(content))
+
+        parsed = self._cache.get(key)
+        digest = key[1] if content is not None else self._digests.get(key)
+
+        if parsed is None or digest is None:
+            if content is None:
+                with open(source) as f:
+                    content = f.read()
+
+                digest = content_digest(content)
+                self._digests.set(key, digest)
+
+            parsed = yaml.load(content, Loader=self.loader) or {}
+            self._cache.set(key, parsed)
+
+        return copy_definition(parsed), digest
+
+
+default_source_cache = SourceCache()
@@ -0,0 +1,166 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# CPU time of the current thread, so concurrent builds don't add up each other's time
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+# Name the stats of the scenario itself (parsing sources, compiling, building) are kept under
+SCENARIO = 'scenario'
+
+
+class PhaseStats(object):
+    """
+    Accumulated calls, objects, wall and cpu time (in seconds) of a phase
+    """
+
+    __slots__ = ('calls', 'objects', 'wall', 'cpu')
+
+    def __init__(self):
+        self.calls = 0
+        self.objects = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def add(self, calls, objects, wall, cpu):
+        self.calls += calls
+        self.objects += objects
+        self.wall += wall
+        self.cpu += cpu
+
+    def as_dict(self):
+        return OrderedDict((k, getattr(self, k)) for k in self.__slots__)
+
+
+class TypeStats(object):
+    """
+    Stats of a single type: phases (like 'defaults', 'format', 'create' or 'resolve') and counters
+    """
+
+    def __init__(self, name, lock):
+        self.name = name
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self._lock = lock
+
+    @staticmethod
+    def start():
+        return time.perf_counter(), _cpu_time()
+
+    def lap(self, phase, started, objects=0):
+        """
+        Records the time since started into a phase
+        :param started: value returned by start or by a previous lap
+        :return: the start of the next lap
+        """
+        now = self.start()
+        self.record(phase, now[0] - started[0], now[1] - started[1], objects)
+        return now
+
+    @contextmanager
+    def measure(self, phase, objects=0):
+        started = self.start()
+        try:
+            yield
+        finally:
+            self.lap(phase, started, objects)
+
+    def record(self, phase, wall, cpu, objects=0, calls=1):
+        with self._lock:
+            if phase not in self.phases:
+                self.phases[phase] = PhaseStats()
+
+            self.phases[phase].add(calls, objects, wall, cpu)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def as_dict(self):
+        return OrderedDict([
+            ('phases', OrderedDict((phase, stats.as_dict()) for phase, stats in self.phases.items())),
+            ('counters', OrderedDict(self.counters)),
+        ])
+
+
+class BuildStats(object):
+    """
+    Timings and counters of everything a scenario does, by type and phase. Scenarios only record them
+    when created with stats enabled, otherwise no measuring code runs at all.
+    """
+
+    def __init__(self):
+        self._types = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        return self.for_type(name)
+
+    def __contains__(self, name):
+        return name in self._types
+
+    def for_type(self, name):
+        """
+        :param name: type name, or SCENARIO for the scenario's own phases
+        :return: TypeStats
+        """
+        stats = self._types.get(name)
+
+        if stats is None:
+            with self._lock:
+                stats = self._types.setdefault(name, TypeStats(name, self._lock))
+
+        return stats
+
+    def measure(self, name, phase, objects=0):
+        return self.for_type(name).measure(phase, objects)
+
+    def count(self, name, counter, amount=1):
+        self.for_type(name).count(counter, amount)
+
+    def merge(self, other):
+        """
+        Adds up the stats of another BuildStats into this one
+        """
+        with self._lock:
+            for name, type_stats in other._types.items():
+                target = self.for_type(name)
+
+                for phase, stats in type_stats.phases.items():
+                    target.record(phase, stats.wall, stats.cpu, stats.objects, stats.calls)
+
+                for counter, amount in type_stats.counters.items():
+                    target.count(counter, amount)
+
+    def reset(self):
+        with self._lock:
+            self._types.clear()
+
+    def as_dict(self):
+        return OrderedDict((name, stats.as_dict()) for name, stats in self._types.items())
+
+    def table(self):
+        """
+        :return: the stats as a readable table, a row per type and phase
+        """
+        header = ('type', 'phase', 'calls', 'objects', 'wall (s)', 'cpu (s)')
+        rows = []
+
+        for name, type_stats in self._types.items():
+            for phase, stats in type_stats.phases.items():
+                rows.append((name, phase, str(stats.calls), str(stats.objects),
+                             '{:.4f}'.format(stats.wall), '{:.4f}'.format(stats.cpu)))
+
+            for counter, amount in type_stats.counters.items():
+                rows.append((name, counter, '', str(amount), '', ''))
+
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        line = '  '.join('{{:{}{}}}'.format('<' if i < 2 else '>', w) for i, w in enumerate(widths))
+
+        return '\n'.join([line.format(*header), line.format(*('-' * w for w in widths))] +
+                         [line.format(*row) for row in rows])
+
+    def __str__(self):
+        return self.table()
@@ -1,6 +1,9 @@
 import six
+import threading
 from collections import defaultdict, OrderedDict
 
+from .retention import get_retention_policy, DISCARD
+
 
 class EntityID(object):
 
@@ -14,49 +17,109 @@ class EntityStoreException(Exception):
 
 
 class EntityManager(object):
+    """
+    A live view over the objects of a type in the EntityStore. Objects are not copied, lookups
+    by identifier or alias go straight to the store's indexes.
+    """
 
-    def __init__(self, type_name, objects=None, aliased_objects=None):
+    def __init__(self, type_name, objects=None, aliased_objects=None, load=None):
         self.type_name = type_name
-        self.identifiers = [str(id) for id in objects.keys()]
-        self.objects = list(objects.values())
-        if aliased_objects:
-            self.aliases = list(aliased_objects.keys())
-            self.aliased_objects = list(aliased_objects.values())
+        self._objects = objects if objects is not None else {}
+        self._aliased_objects = aliased_objects if aliased_objects is not None else {}
+        # Turns the values kept in the store into objects, when the store doesn't keep the objects themselves
+        self._load = load
+        self._values_list = None
+
+    @property
+    def _values(self):
+        # Positional access needs a list, built only when the type changes
+        if self._values_list is None:
+            self._values_list = list(self._objects.values())
+
+        return self._values_list
+
+    @property
+    def objects(self):
+        # A copy, the list of values drives positional access
+        if self._load is None:
+            return list(self._values)
+
+        return [self._load(v) for v in self._values]
+
+    @property
+    def identifiers(self):
+        return [str(id) for id in self._objects.keys()]
+
+    @property
+    def aliases(self):
+        return list(self._aliased_objects.keys())
+
+    @property
+    def aliased_objects(self):
+        return [self._load(v) if self._load else v for v in self._aliased_objects.values()]
+
+    def _object_added(self, value):
+        if self._values_list is not None:
+            self._values_list.append(value)
+
+    def _invalidate(self):
+        self._values_list = None
 
     def __repr__(self):
         return str(self.objects)
 
     def __getitem__(self, key):
         try:
-            item = self.objects[key]
-            return item
+            if isinstance(key, six.string_types):
+                return self._find(key)
+
+            item = self._values[key]
+            return self._load(item) if self._load else item
         except:
             raise EntityStoreException(
                 "{} type name has no object with identifier: {}".format(self.type_name, key)
             )
 
+    def __iter__(self):
+        if self._load is None:
+            return iter(self._values)
+
+        return iter(self.objects)
+
     def __len__(self):
-        return len(self.objects)
+        return len(self._objects)
 
     def __contains__(self, item):
+        if self._load is None:
+            return item in self._values
+
         return item in self.objects
 
+    def _find(self, identifier):
+        if identifier in self._objects:
+            value = self._objects[identifier]
+
+        elif identifier.isdigit() and int(identifier) in self._objects:
+            value = self._objects[int(identifier)]
+
+        else:
+            value = self._aliased_objects[identifier]
+
+        return self._load(value) if self._load else value
+
     def __getattr__(self, name):
-        attr_parts = name.split('_')
-        requested_type_name, requested_identifier = attr_parts
+        if name.startswith('_'):
+            raise AttributeError(name)
 
-        if requested_type_name != self.type_name:
-            raise EntityStoreException("Invalid type name: {}".format(requested_type_name))
+        prefix = self.type_name + '_'
 
-        if requested_identifier not in self.identifiers and requested_identifier not in self.aliases:
-            raise EntityStoreException("Object not found: {}".format(name))
+        if not name.startswith(prefix):
+            raise EntityStoreException("Invalid type name: {}".format(name.split('_')[0]))
 
         try:
-            object_index = self.identifiers.index(requested_identifier)
-            return self.objects[object_index]
-        except ValueError:
-            object_index = self.aliases.index(requested_identifier)
-            return self.aliased_objects[object_index]
+            return self._find(name[len(prefix):])
+        except KeyError:
+            raise EntityStoreException("Object not found: {}".format(name))
 
 
 class EntityStore(object):
@@ -64,12 +127,19 @@ class EntityStore(object):
     ID = 'id'
     ALIAS = '_alias'
 
-    def __init__(self):
+    def __init__(self, retention=None):
+        """
+        :param retention: RetentionPolicy, or its name, deciding what is kept for every object. Full by default
+        """
+        self.retention = get_retention_policy(retention)
         self._objects = defaultdict(dict)
         self._aliased_objects = defaultdict(dict)
         self._objects_id_counter = defaultdict(lambda: 1)  # start off counter from 1
+        self._managers = {}
+        self._lock = threading.RLock()
 
     def reset(self):
+        self._managers.clear()
         self._objects.clear()
         self._aliased_objects.clear()
         self._objects_id_counter.clear()
@@ -108,26 +178,115 @@ class EntityStore(object):
     def has_type(self, type_name):
         return type_name in self._objects
 
+    def has_object(self, type_name, identifier):
+        return identifier in self._objects.get(type_name, ())
+
     def add(self, obj, type_name, entity_id=None):
+        with self._lock:
+            return self._add(obj, type_name, entity_id)
+
+    def _add(self, obj, type_name, entity_id=None):
         if not entity_id:
             entity_id = EntityID()
 
         if entity_id.alias in self._aliased_objects[type_name]:
             raise EntityStoreException("Duplicated alias for {}".format(type_name))
 
-        if entity_id.identifier in self._objects[type_name]:
+        relocated = entity_id.identifier in self._objects[type_name]
+        if relocated:
             self._relocate_object(entity_id, type_name)
 
         elif not entity_id or not entity_id.identifier:
             entity_id.identifier = self._generate_id(type_name)
 
-        self._objects[type_name][entity_id.identifier] = obj
+        value = self.retention.store(type_name, entity_id.identifier, obj)
+        if value is DISCARD:
+            # Keep the type around even if none of its objects is
+            self._objects[type_name]
+            return entity_id
+
+        self._objects[type_name][entity_id.identifier] = value
 
         if entity_id.alias:
-            self._aliased_objects[type_name][entity_id.alias] = obj
+            self._aliased_objects[type_name][entity_id.alias] = value
+
+        if type_name in self._managers:
+            if relocated:
+                self._managers[type_name]._invalidate()
+            else:
+                self._managers[type_name]._object_added(value)
 
         return entity_id
 
+    def entities(self):
+        """
+        :return: generator of (type name, EntityID, object) of every object in the store
+        """
+        for type_name in list(self._objects):
+            aliases = dict((id(value), alias) for alias, value in self._aliased_objects[type_name].items())
+
+            for identifier, value in list(self._objects[type_name].items()):
+                obj = value if self.retention.transparent else self.retention.load(type_name, identifier, value)
+                yield type_name, EntityID(identifier, aliases.get(id(value))), obj
+
+    def restore(self, value, type_name, entity_id):
+        """
+        Adds a value already turned into what the retention policy keeps, like the key of an object
+        stored somewhere else. Identifiers must be given.
+        """
+        with self._lock:
+            self._objects[type_name][entity_id.identifier] = value
+
+            if entity_id.alias:
+                self._aliased_objects[type_name][entity_id.alias] = value
+
+            if type_name in self._managers:
+                self._managers[type_name]._object_added(value)
+
+    def referenced(self, type_name, identifier):
+        """
+        Notifies that a planned reference to an object was resolved, the retention policy might drop it
+        """
+        with self._lock:
+            if self.retention.referenced(type_name, identifier):
+                self.discard(type_name, identifier)
+
+    def discard(self, type_name, identifier):
+        """
+        Drops an object from the store
+        """
+        with self._lock:
+            value = self._objects.get(type_name, {}).pop(identifier, None)
+            if value is None:
+                return
+
+            aliases = self._aliased_objects[type_name]
+            for alias in [a for a, v in aliases.items() if v is value]:
+                aliases.pop(alias)
+
+            if type_name in self._managers:
+                self._managers[type_name]._invalidate()
+
+    def _reorder(self, type_name, identifiers, aliases):
+        """
+        Sorts the objects of a type, used when they were added in no particular order
+        :param type_name: type to sort
+        :param identifiers: the identifiers of the type to sort, in the expected order. Objects not listed
+                            go first, in the order they are
+        :param aliases: the aliases of the type to sort, in the expected order
+        """
+        with self._lock:
+            for objects, keys in ((self._objects[type_name], identifiers),
+                                  (self._aliased_objects[type_name], aliases)):
+                sorted_keys = set(keys)
+                items = [(k, v) for k, v in objects.items() if k not in sorted_keys]
+                items.extend((k, objects[k]) for k in keys if k in objects)
+                objects.clear()
+                objects.update(items)
+
+            if type_name in self._managers:
+                self._managers[type_name]._invalidate()
+
     def get(self, type_name, ref):
         e = self._aliased_objects.get(type_name, {}).get(ref, None) \
             or self._objects.get(type_name, {}).get(ref, None)
@@ -142,9 +301,23 @@ class EntityStore(object):
         except:
             pass
 
+        if e is not None and not self.retention.transparent:
+            e = self.retention.load(type_name, None, e)
+
         return e
 
     def all(self, type_name):
-        objects = self._objects.get(type_name, {})
-        aliased_objects = self._aliased_objects.get(type_name, {})
-        return EntityManager(type_name, objects=objects, aliased_objects=aliased_objects)
+        if not self.has_type(type_name):
+            return EntityManager(type_name)
+
+        if type_name not in self._managers:
+            load = None
+            if not self.retention.transparent:
+                load = lambda value: self.retention.load(type_name, None, value)
+
+            self._managers[type_name] = EntityManager(type_name,
+                                                      objects=self._objects[type_name],
+                                                      aliased_objects=self._aliased_objects[type_name],
+                                                      load=load)
+
+        return self._managers[type_name]
@@ -0,0 +1,241 @@
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import closing
+
+import six
+
+from .errors import ScenariousException
+from .compiled import artifact_key
+from .retention import Key
+from .scenario import Scenario
+from .source_cache import content_digest, source_digest
+from .store_handler import EntityID
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+# Table of the template database with its key and the primary key of every object of the scenario
+_TEMPLATE_TABLE = 'scenarious_template'
+
+# Handlers bound to a live copy, since their session is shared by the whole class only one copy can use them at a time
+_cloned_handlers = set()
+_cloned_lock = threading.Lock()
+
+
+class SQLiteTemplate(object):
+    """
+    A scenario built once into a template SQLite database file, so every test gets a copy of the database
+    instead of building the scenario again. Copies are made with the sqlite3 backup API (or a file copy)
+    and come with a Scenario whose store loads every object from the copy by primary key.
+
+    The template is keyed by the content of the sources and the code of the type handlers and their models,
+    so it's only built again when any of them changes. Handlers must create objects through their session
+    (transactional or bulk handlers), which is bound to the template database while it's built and to
+    every copy afterwards. Handlers have a single session, so a copy must be disposed before the handlers
+    can be cloned again.
+    """
+
+    def __init__(self, path, sources, handlers, metadata, session_factory=None, **kwargs):
+        """
+        :param path: path of the template database file
+        :param sources: list of scenario sources, strings are taken as yaml definitions
+        :param handlers: type handlers of the scenario
+        :param metadata: SQLAlchemy MetaData with the tables of the handlers' models
+        :param session_factory: function creating a session out of an engine, a plain Session by default
+        :param kwargs: any other argument of Scenario.load, like seed
+        """
+        self.path = path
+        self.handlers = list(handlers)
+        self.metadata = metadata
+        self.session_factory = session_factory
+        self.scenario_kwargs = kwargs
+        self._sources = [StringIO(s) if isinstance(s, six.string_types) else s for s in sources]
+        self._entities = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        digests = []
+        for i, source in enumerate(self._sources):
+            digest, self._sources[i] = source_digest(source)
+            digests.append(digest)
+
+        models = [h.__model__ for h in self.handlers if getattr(h, '__model__', None) is not None]
+        tables = content_digest(repr(sorted(self.metadata.tables)))
+
+        return artifact_key(digests + [tables], self.handlers + models, self.scenario_kwargs.get('seed'),
+                            self.scenario_kwargs.get('shard'))
+
+    def ensure(self):
+        """
+        Builds the template database unless it's already built out of the same sources and handlers
+        """
+        with self._lock:
+            if self._entities is not None:
+                return
+
+            key = self.key
+            self._entities = self._read(key)
+
+            if self._entities is None:
+                self._entities = self._build(key)
+
+    def clone(self, path=None):
+        """
+        Copies the template database and binds the handlers to a session of the copy
+        :param path: file to copy the template to, an in-memory database by default
+        :return: Scenario with every object of the template, loaded from the copy when accessed
+        """
+        self.ensure()
+
+        with _cloned_lock:
+            cloned = [h.__name__ for h in self.handlers if h in _cloned_handlers]
+            if cloned:
+                raise ScenariousException("{} already bound to a copy that wasn't disposed, only one copy can be "
+                                          "used at a time".format(', '.join(cloned)))
+
+            _cloned_handlers.update(self.handlers)
+
+        try:
+            return self._clone(path)
+
+        except Exception:
+            with _cloned_lock:
+                _cloned_handlers.difference_update(self.handlers)
+            raise
+
+    def _clone(self, path):
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import StaticPool
+
+        if path is None:
+            # A single connection, otherwise every connection would get a database of its own
+            engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+            connection = engine.raw_connection()
+            try:
+                with closing(sqlite3.connect(self.path)) as template:
+                    template.backup(getattr(connection, 'driver_connection', None) or connection.connection)
+            finally:
+                connection.close()
+
+        else:
+            with closing(sqlite3.connect(self.path)) as template, closing(sqlite3.connect(path)) as target:
+                template.backup(target)
+
+            engine = create_engine('sqlite:///' + path)
+
+        session = self._new_session(engine)
+        previous = self._bind(session)
+
+        scenario = Scenario.load({}, self.handlers, autobuild=False, retention='keys')
+        store = scenario._entity_store
+        for type_name, identifier, alias, key in self._entities:
+            store.restore(Key(key), type_name, EntityID(identifier, alias))
+
+        self._sessions[id(scenario)] = (session, engine, previous)
+        return scenario
+
+    def dispose(self, scenario):
+        """
+        Closes the copy of a cloned scenario and binds the handlers back to their previous sessions
+        """
+        session, engine, previous = self._sessions.pop(id(scenario))
+        session.close()
+        engine.dispose()
+
+        for handler, handler_session in previous:
+            handler.bind_session(handler_session)
+
+        with _cloned_lock:
+            _cloned_handlers.difference_update(self.handlers)
+
+    def _new_session(self, engine):
+        if self.session_factory is not None:
+            return self.session_factory(engine)
+
+        from sqlalchemy.orm import Session
+        return Session(bind=engine)
+
+    def _bind(self, session):
+        """
+        :return: list of (handler, previous session)
+        """
+        return [(handler, handler.bind_session(session)) for handler in self.handlers
+                if hasattr(handler, 'bind_session')]
+
+    def _read(self, key):
+        """
+        :return: the entities of the template database if it was built with the given key, None otherwise
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with closing(sqlite3.connect(self.path)) as connection:
+                row = connection.execute('SELECT key, entities FROM {}'.format(_TEMPLATE_TABLE)).fetchone()
+
+        except sqlite3.DatabaseError:
+            return None
+
+        return pickle.loads(row[1]) if row and row[0] == key else None
+
+    def _build(self, key):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import object_session
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        engine = create_engine('sqlite:///' + self.path)
+        self.metadata.create_all(engine)
+        session = self._new_session(engine)
+        previous = self._bind(session)
+
+        try:
+            scenario = Scenario.load(self._sources[0], self.handlers, autobuild=False, **self.scenario_kwargs)
+            for source in self._sources[1:]:
+                scenario.update(source)
+
+            scenario.build()
+            session.commit()
+
+            entities = []
+            store = scenario._entity_store
+            for type_name, objects in store._objects.items():
+                aliases = dict((id(obj), alias) for alias, obj in store._aliased_objects[type_name].items())
+                handler = scenario._get_type_handler(type_name)
+
+                for identifier, obj in objects.items():
+                    if object_session(obj) is not session:
+                        raise ScenariousException(
+                            "{} creates objects outside of its session, templates need handlers creating objects "
+                            "through it (transactional or bulk handlers)".format(handler.__name__))
+
+                    entities.append((type_name, identifier, aliases.get(id(obj)), handler.get_key(obj)))
+
+            with closing(sqlite3.connect(self.path)) as connection, connection:
+                connection.execute('CREATE TABLE {} (key TEXT, entities BLOB)'.format(_TEMPLATE_TABLE))
+                connection.execute('INSERT INTO {} VALUES (?, ?)'.format(_TEMPLATE_TABLE),
+                                   (key, pickle.dumps(entities, pickle.HIGHEST_PROTOCOL)))
+
+        except Exception:
+            session.close()
+            engine.dispose()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            raise
+
+        finally:
+            for handler, handler_session in previous:
+                handler.bind_session(handler_session)
+
+        session.close()
+        engine.dispose()
+
+        return entities
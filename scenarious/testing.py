@@ -3,9 +3,145 @@ try:
 except ImportError:
     from io import StringIO
 
+import atexit
+import asyncio
 from functools import wraps
+from collections import OrderedDict
 from .type_handlers.base import TypeHandlerLoader
-from .scenario import Scenario
+from .scenario import Scenario, ScenariousException
+from .stats import BuildStats, SCENARIO
+
+
+# Stats of every scenario built for tests, only recorded once enabled
+_aggregate_stats = None
+
+
+def enable_stats():
+    """
+    Records the stats of every scenario built for tests from now on, added up in a single BuildStats
+    :return: BuildStats with the aggregate stats
+    """
+    global _aggregate_stats
+
+    if _aggregate_stats is None:
+        _aggregate_stats = BuildStats()
+
+    return _aggregate_stats
+
+
+def aggregate_stats():
+    """
+    :return: BuildStats with the stats of every scenario built for tests since stats were enabled, or None
+    """
+    return _aggregate_stats
+
+
+def _record_stats(scenario):
+    if _aggregate_stats is not None and scenario.build_stats is not None:
+        _aggregate_stats.merge(scenario.build_stats)
+        _aggregate_stats.count(SCENARIO, 'scenarios')
+
+
+# Scopes a scenario can be built for: every test, or once for all the tests of a class, a module or the session
+SCOPES = ('function', 'class', 'module', 'session')
+
+# Scenarios shared by the tests of a scope, by (scope, scope key, scenario key)
+_shared_scenarios = OrderedDict()
+
+
+class SharedScenario(object):
+    """
+    A scenario built once and used by many tests. Its handlers undo what every test does (SQLAlchemy handlers
+    roll back a savepoint) and the store keeps only the keys of the objects, so every test loads them again.
+    Objects of handlers that can't undo changes are shared as they are.
+    """
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.handlers = []
+        for handler in scenario._type_handlers.values():
+            if handler not in self.handlers:
+                self.handlers.append(handler)
+
+        # What begin_scope returned for every handler whose scope began, handlers are shared by other scenarios
+        self._scopes = []
+
+    def build(self):
+        try:
+            for handler in self.handlers:
+                self._scopes.append((handler, handler.begin_scope()))
+
+            self.scenario.build()
+            self._check_scoped()
+            self.scenario.retain('keys')
+
+        except Exception:
+            self.close()
+            raise
+
+        finally:
+            self.end_test()
+
+        _record_stats(self.scenario)
+
+    def _check_scoped(self):
+        scopes = dict(self._scopes)
+
+        for type_name, _, obj in self.scenario._entity_store.entities():
+            handler = self.scenario._get_type_handler(type_name)
+            if not handler.is_scoped(obj, scopes.get(handler)):
+                raise ScenariousException(
+                    "{} creates objects outside of the scope of the shared scenario, so they wouldn't be undone. "
+                    "Shared scenarios need handlers creating objects through their session (transactional or bulk "
+                    "handlers)".format(handler.__name__))
+
+    def begin_test(self):
+        for handler, scope in self._scopes:
+            handler.begin_test(scope)
+
+    def end_test(self):
+        for handler, scope in reversed(self._scopes):
+            handler.end_test(scope)
+
+    def close(self):
+        for handler, scope in reversed(self._scopes):
+            handler.end_scope(scope)
+
+        self._scopes = []
+
+
+def _scope_key(scope, test_class):
+    if scope not in SCOPES:
+        raise ScenariousException("Invalid scope '{}', expected one of: {}".format(scope, ', '.join(SCOPES)))
+
+    if scope == 'class':
+        return test_class
+
+    if scope == 'module':
+        return test_class.__module__
+
+    return None
+
+
+def release_scenarios(scope=None, test_class=None):
+    """
+    Closes the shared scenarios of a scope, or of every scope. When test_class is given, only the ones
+    of other classes and modules are closed, since tests of a class or module run one after the other.
+    """
+    for key in list(_shared_scenarios):
+        shared_scope, scope_key = key[:2]
+
+        if scope is not None and shared_scope != scope:
+            continue
+
+        if test_class is not None and (shared_scope == 'session' or
+                                       scope_key == _scope_key(shared_scope, test_class)):
+            continue
+
+        _shared_scenarios.pop(key).close()
+
+
+atexit.register(release_scenarios)
 
 
 class ScenariousBaseTest(object):
@@ -13,12 +149,51 @@ class ScenariousBaseTest(object):
     scenario_handler = Scenario
     type_handler_loader = TypeHandlerLoader
 
+    # Scope of the scenarios created by the tests, one of SCOPES
+    scenario_scope = 'function'
+
     def __init__(self, *args, **kwargs):
         self._scenario = None
         super(ScenariousBaseTest, self).__init__(*args, **kwargs)
 
     @classmethod
     def build_scenario(cls, *data_streams, **kwargs):
+        scenario = cls._load_scenario(*data_streams, **kwargs)
+        scenario.build()
+        _record_stats(scenario)
+        return scenario
+
+    @classmethod
+    async def abuild_scenario(cls, *data_streams, **kwargs):
+        concurrency = kwargs.pop('concurrency', None)
+        scenario = cls._load_scenario(*data_streams, **kwargs)
+        await scenario.abuild(concurrency=concurrency)
+        _record_stats(scenario)
+        return scenario
+
+    @classmethod
+    def share_scenario(cls, scope, test_class, *data_streams, **kwargs):
+        """
+        Gets the scenario shared by the tests of a scope, building it the first time
+        :param scope: one of SCOPES but 'function'
+        :param test_class: class of the test using the scenario
+        :return: SharedScenario
+        """
+        release_scenarios(test_class=test_class)
+
+        key = (scope, _scope_key(scope, test_class), repr(data_streams), tuple(kwargs.get('handlers') or ()),
+               kwargs.get('scenario_class'))
+        shared = _shared_scenarios.get(key)
+
+        if shared is None:
+            shared = SharedScenario(cls._load_scenario(*data_streams, **kwargs))
+            shared.build()
+            _shared_scenarios[key] = shared
+
+        return shared
+
+    @classmethod
+    def _load_scenario(cls, *data_streams, **kwargs):
         handlers = kwargs.pop('handlers', None)
         scenario_class = kwargs.pop('scenario_class', None) or cls.scenario_handler
 
@@ -29,15 +204,53 @@ class ScenariousBaseTest(object):
             data = StringIO(data_stream) if type(data_stream) is str else data_stream
 
             if not scenario:
-                scenario = scenario_class.load(data, handlers or cls.type_handler_loader.load(), autobuild=False)
+                scenario = scenario_class.load(data, handlers or cls.type_handler_loader.load(), autobuild=False,
+                                               stats=_aggregate_stats is not None)
             else:
                 scenario.update(data)
 
-        scenario.build()
         return scenario
 
     def create_scenario(self, *data_streams, **kwargs):
-        self._scenario = self.build_scenario(*data_streams, **kwargs)
+        """
+        Builds the scenario of the test
+        :param scope: builds the scenario once for every test of the scope, one of SCOPES. Changes made
+                      by the test are undone once it finishes
+        """
+        scope = kwargs.pop('scope', None) or self.scenario_scope
+
+        if scope == 'function':
+            release_scenarios(test_class=type(self))
+            self._scenario = self.build_scenario(*data_streams, **kwargs)
+            return
+
+        shared = self.share_scenario(scope, type(self), *data_streams, **kwargs)
+        shared.begin_test()
+        self.addCleanup(shared.end_test)
+        self._scenario = shared.scenario
+
+    async def acreate_scenario(self, *data_streams, **kwargs):
+        self._scenario = await self.abuild_scenario(*data_streams, **kwargs)
+
+    def update_scenario(self, *data_streams):
+        """
+        Adds definitions to the scenario of the test, only the new entities are created.
+        Shared scenarios can't be updated, since the update would outlive the test
+        """
+        if any(shared.scenario is self._scenario for shared in _shared_scenarios.values()):
+            raise ScenariousException("Scenarios shared by many tests can't be updated, the update would outlive "
+                                      "the test")
+
+        for data_stream in data_streams:
+            self._scenario.update(StringIO(data_stream) if type(data_stream) is str else data_stream)
+
+        self._scenario.build()
+
+    def clone_scenario(self, template):
+        """
+        Uses a copy of the database of a SQLiteTemplate as the scenario of the test
+        """
+        self._scenario = template.clone()
 
     def __getattr__(self, item):
         if '_scenario' not in self.__dict__:
@@ -53,15 +266,75 @@ class ScenariousBaseTest(object):
 def scenario(*data_streams, **kwargs):
     handlers = kwargs.pop('handlers', None)
     scenario_class = kwargs.pop('scenario_class', None)
+    concurrency = kwargs.pop('concurrency', None)
+    # A SQLiteTemplate every test gets a copy of, instead of building the scenario
+    template = kwargs.pop('template', None)
+    scope = kwargs.pop('scope', None)
 
     def test_decorator(f):
+        if scope not in (None, 'function') and asyncio.iscoroutinefunction(f):
+            raise ScenariousException("Shared scenarios can't be built with async handlers")
+
+        if template is not None:
+            @wraps(f)
+            def cloned_test_decorated(self, *args, **kwargs):
+                if isinstance(self, ScenariousBaseTest):
+                    self.clone_scenario(template)
+                    cloned = self._scenario
+                else:
+                    cloned = kwargs['scenario'] = template.clone()
+
+                try:
+                    return f(self, *args, **kwargs)
+                finally:
+                    template.dispose(cloned)
+
+            return cloned_test_decorated
+
+        if asyncio.iscoroutinefunction(f):
+            # Coroutine tests get their scenario built with the async handlers
+            @wraps(f)
+            async def async_test_decorated(self, *args, **kwargs):
+                if isinstance(self, ScenariousBaseTest):
+                    await self.acreate_scenario(*data_streams, handlers=handlers, concurrency=concurrency)
+                else:
+                    kwargs['scenario'] = await ScenariousBaseTest.abuild_scenario(*data_streams,
+                                                                                  handlers=handlers,
+                                                                                  scenario_class=scenario_class,
+                                                                                  concurrency=concurrency)
+                await f(self, *args, **kwargs)
+
+            return async_test_decorated
+
         @wraps(f)
         def test_decorated(self, *args, **kwargs):
             # TODO: If we want to have a base scenario defined in the setUp
             # we might want to add the data from data_stream into that scenario
             # instead of just replace it
+            base_test = isinstance(self, ScenariousBaseTest)
+            test_scope = scope or (self.scenario_scope if base_test else 'function')
+
+            if test_scope != 'function':
+                # Built once for the whole scope, what the test changes is undone afterwards
+                owner = type(self) if base_test else ScenariousBaseTest
+                shared = owner.share_scenario(test_scope, type(self), *data_streams, handlers=handlers,
+                                              scenario_class=scenario_class)
+                shared.begin_test()
+
+                try:
+                    if base_test:
+                        self._scenario = shared.scenario
+                    else:
+                        kwargs['scenario'] = shared.scenario
+
+                    return f(self, *args, **kwargs)
+
+                finally:
+                    shared.end_test()
+
+            release_scenarios(test_class=type(self))
 
-            if isinstance(self, ScenariousBaseTest):
+            if base_test:
                 self.create_scenario(*data_streams, handlers=handlers)
                 f(self, *args, **kwargs)
             else:
@@ -1,2 +1,3 @@
 from .base import TypeHandlerLoader, TypeHandler, TypeHandlerException, faker
+from .columns import ColumnGenerator, IntegerColumn, FloatColumn, ChoiceColumn, DateColumn, FakerColumn
 from .sql_alchemy import SQLAlchemyTypeHandler, SQLAlchemyTypeHandlerLoader
@@ -1,8 +1,11 @@
 import types
 import inspect
 import six
+from datetime import datetime
 from faker import Faker
-from scenarious.util import module_dir, ModuleLoader
+from scenarious.util import module_dir, ModuleLoader, LRUCache
+from scenarious.seeding import seeded
+from scenarious.type_handlers.columns import ColumnGenerator
 
 try:
     from dateparser import parse as dparse
@@ -13,27 +16,159 @@ except ImportError:
 
 faker = Faker()
 
+ISO_DATE_FORMATS = (
+    '%Y-%m-%d',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d %H:%M',
+)
+
+_parsed_dates = LRUCache(max_size=4096)
+_not_cached = object()
+
 
 class TypeHandlerException(Exception):
     pass
 
 
+def _parse_iso_date(date_str):
+    if hasattr(datetime, 'fromisoformat'):
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            return None
+
+    return _parse_strict_date(date_str, ISO_DATE_FORMATS)
+
+
+def _parse_strict_date(date_str, formats):
+    for date_format in formats:
+        try:
+            return datetime.strptime(date_str, date_format)
+        except ValueError:
+            pass
+
+    return None
+
+
+def parse_date(date_str, formats=(), fuzzy=True):
+    """
+    Parses a date trying ISO-8601 first, then every strict format and finally the fuzzy parser
+    (dateparser or dateutil). ISO and strict results are cached since scenarios tend to repeat the same dates,
+    fuzzy ones aren't since they can be relative to the current time (like 'now' or '2 days ago').
+    :param date_str: date to parse
+    :param formats: strptime formats to try before falling back to the fuzzy parser
+    :param fuzzy: whether the fuzzy parser can be used
+    :return: datetime
+    """
+    key = (date_str, formats)
+    value = _parsed_dates.get(key, _not_cached)
+
+    if value is _not_cached:
+        # Dates needing the fuzzy parser are cached as None, so the strict parsers aren't tried again
+        value = _parse_iso_date(date_str) or _parse_strict_date(date_str, formats)
+        _parsed_dates.set(key, value)
+
+    if value is None:
+        if not fuzzy:
+            raise TypeHandlerException("Invalid date '{}', expected ISO-8601 or one of the formats '{}'"
+                                       .format(date_str, "', '".join(formats)))
+        value = dparse(date_str)
+
+    return value
+
+
+class HandlerTemplate(object):
+    """
+    Everything a handler needs to create objects that only depends on the handler class:
+    static defaults, default generators (lambdas), column generators, required fields and special methods.
+    """
+
+    def __init__(self, handler):
+        self.requirements = frozenset(handler._requirements())
+
+        data = handler._base_attributes(handler)
+        data.update(dict(handler.__dict__))
+
+        self.defaults = {}
+        self.generators = []
+        self.columns = []
+
+        for k, v in data.items():
+            if k.startswith('__'):
+                continue
+
+            cls_attr = getattr(handler, k)
+            if isinstance(v, ColumnGenerator):
+                self.columns.append((k, v))
+
+            elif isinstance(v, types.LambdaType):
+                self.generators.append((k, v))
+
+            elif not callable(cls_attr):
+                self.defaults[k] = v
+
+        self.special_methods = {}
+        for name in dir(handler):
+            if not name.startswith('__'):
+                attr = getattr(handler, name)
+                if callable(attr) and not isinstance(attr, ColumnGenerator):
+                    self.special_methods['_' + name] = attr
+
+        # Handlers without a constructor of their own don't need to be instantiated on every create
+        self.custom_init = six.get_unbound_function(handler.__init__) is not \
+            six.get_unbound_function(TypeHandler.__init__)
+
+
 class TypeHandler(object):
     __type_name__ = None
     __requires__ = None
 
+    # Date formats tried after ISO-8601 and whether to fall back to the (slow) fuzzy date parser
+    __date_formats__ = ()
+    __fuzzy_dates__ = True
+
     def __init__(self, **kwargs):
         for k in self.requirements():
             if hasattr(self, k):
                 raise TypeHandlerException("Field '{}' is required but also has a default value. "
                                            "Required fields cannot have default values".format(k))
 
+    @classmethod
+    def template(cls):
+        """
+        Gets the creation template of the handler, computed once per handler class
+        :return: HandlerTemplate
+        """
+        template = cls.__dict__.get('__template__')
+
+        if template is None:
+            template = HandlerTemplate(cls)
+            cls.__template__ = template
+
+            if not template.custom_init:
+                # The constructor only validates the class, so do it once here
+                try:
+                    cls()
+                except Exception:
+                    del cls.__template__
+                    raise
+
+        return template
+
     @classmethod
     def requirements(cls):
         """
         Gets the requirements from every handler's parent
         :return: list of required attributes
         """
+        return set(cls.template().requirements)
+
+    @classmethod
+    def _requirements(cls):
         reqs = set(cls.__requires__ or [])
 
         for base in cls.__bases__:
@@ -47,48 +182,236 @@ class TypeHandler(object):
     def validate_data(cls, data):
         missing = []
 
-        for k in cls.requirements():
+        for k in cls.template().requirements:
             if k not in data:
                 missing.append(k)
 
         if missing:
             raise TypeHandlerException("{} Required fields '{}'  are missing".format(cls.__name__, ','.join(missing)))
 
+    @classmethod
+    def begin_build(cls):
+        """
+        Called once before a scenario starts creating objects with this handler
+        """
+        pass
+
+    @classmethod
+    def end_build(cls, error=None):
+        """
+        Called once after a scenario finished creating objects with this handler
+        :param error: the exception that made the build fail, if any
+        """
+        pass
+
+    @classmethod
+    def begin_scope(cls):
+        """
+        Called before building a scenario shared by many tests, handlers able to undo what every test
+        does get ready to do it here
+        :return: state of the handler for the shared scenario, handed to the rest of the scope hooks
+        """
+        return None
+
+    @classmethod
+    def begin_test(cls, scope=None):
+        """
+        Called before every test using a shared scenario
+        :param scope: what begin_scope returned for the shared scenario
+        """
+        pass
+
+    @classmethod
+    def end_test(cls, scope=None):
+        """
+        Called after every test using a shared scenario, and once the shared scenario is built.
+        Changes made since begin_test should be undone
+        :param scope: what begin_scope returned for the shared scenario
+        """
+        pass
+
+    @classmethod
+    def is_scoped(cls, obj, scope=None):
+        """
+        Tells whether an object of a shared scenario was created within the scope, so what tests do to it is undone
+        :param obj: object created by this handler
+        :param scope: what begin_scope returned for the shared scenario
+        """
+        return True
+
+    @classmethod
+    def end_scope(cls, scope=None):
+        """
+        Called once a shared scenario isn't needed anymore
+        :param scope: what begin_scope returned for the shared scenario
+        """
+        pass
+
+    @classmethod
+    def on_reference(cls, obj, attrs):
+        """
+        Called before accessing the attributes of a referenced object created by this handler
+        :param obj: referenced object
+        :param attrs: list of attributes that will be accessed
+        """
+        pass
+
+    @classmethod
+    def get_key_attribute(cls):
+        """
+        Gets the attribute sharded scenarios assign the planned id of every object to
+        :return: attribute name, None if objects can't be created with their id
+        """
+        return 'id'
+
+    @classmethod
+    def prepare_keys(cls, objs):
+        """
+        Called with every batch of objects created before their keys are taken, so handlers can get
+        them ready at once (like flushing them to get their primary keys)
+        :param objs: objects created by this handler
+        """
+        pass
+
+    @classmethod
+    def get_key(cls, obj):
+        """
+        Gets a key the object can be loaded back with, used by the 'keys' retention policy
+        :param obj: object created by this handler
+        :return: the object's key
+        """
+        raise TypeHandlerException("{} doesn't support loading objects by key".format(cls.__name__))
+
+    @classmethod
+    def load(cls, key):
+        """
+        Loads back an object created by this handler, used by the 'keys' retention policy
+        :param key: key returned by get_key
+        :return: the object
+        """
+        raise TypeHandlerException("{} doesn't support loading objects by key".format(cls.__name__))
+
     @classmethod
     def is_method(cls, attr):
         return attr.startswith('_')
 
     @classmethod
     def get_special_method(cls, value):
-        return getattr(cls, value[1:]) if cls.is_method(value) else None
+        if not cls.is_method(value):
+            return None
+
+        method = cls.template().special_methods.get(value)
+        return method if method is not None else getattr(cls, value[1:])
 
     @classmethod
     def create(cls, **kwargs):
-        cls.validate_data(kwargs)
+        return cls._do_create(cls.prepare_data(**kwargs))
+
+    @classmethod
+    async def acreate(cls, **kwargs):
+        """
+        Async version of create, to be used from an event loop
+        """
+        return await cls._ado_create(cls.prepare_data(**kwargs))
 
-        handler = cls(**kwargs)
-        data = cls._base_attributes(cls)
-        data.update(dict(cls.__dict__))
+    @classmethod
+    def create_many(cls, definitions, seeds=None, stats=None):
+        """
+        Creates an object for every definition. Handlers can provide a faster way of creating
+        many objects at once by overriding _do_create_many
+        :param definitions: list of dicts with the kwargs for each object
+        :param seeds: list with the seed to generate the data of each object with
+        :param stats: TypeStats to record the time spent on every phase in
+        :return: list of created objects, in the same order as the definitions
+        """
+        data_list = cls.prepare_many(definitions, seeds, stats)
 
-        for k, v in dict(data).items():
-            cls_attr = getattr(cls, k)
-            if k.startswith('__') or (callable(cls_attr) and not isinstance(v, types.LambdaType)):
-                data.pop(k)
+        if stats is None:
+            return cls._do_create_many(data_list)
 
-            elif isinstance(v, types.LambdaType):
-                data[k] = v()
+        with stats.measure('create', len(data_list)):
+            return cls._do_create_many(data_list)
+
+    @classmethod
+    def prepare_many(cls, definitions, seeds=None, stats=None):
+        """
+        Builds the data of an object for every definition
+        :param definitions: list of dicts with the kwargs for each object
+        :param seeds: list with the seed to generate the data of each object with
+        :param stats: TypeStats to record the time spent on every phase in
+        :return: list of dicts with the data to create the objects with
+        """
+        if seeds is not None:
+            return [cls._prepare_data(kwargs, seed=seed, stats=stats) for kwargs, seed in zip(definitions, seeds)]
+
+        started = stats.start() if stats is not None else None
+
+        # Column generators produce the values of every definition at once
+        columns = [(k, column.generate(len(definitions))) for k, column in cls.template().columns] \
+            if definitions else []
+
+        if stats is not None and columns:
+            stats.lap('columns', started, len(definitions))
+
+        return [cls._prepare_data(kwargs, columns, i, stats=stats) for i, kwargs in enumerate(definitions)]
+
+    @classmethod
+    def prepare_data(cls, **kwargs):
+        """
+        Builds the data for a new object applying defaults, the user provided data and formatting
+        :return: dict with the data to create the object with
+        """
+        return cls._prepare_data(kwargs)
+
+    @classmethod
+    def _prepare_data(cls, kwargs, columns=None, index=None, seed=None, stats=None):
+        """
+        :param kwargs: user provided data
+        :param columns: list of (attribute, values) generated for many objects at once
+        :param index: position of the object's values in the columns
+        :param seed: seed for faker, random and numpy while generating the object's data
+        :param stats: TypeStats to record the time spent generating defaults and formatting in
+        """
+        if seed is not None:
+            with seeded(seed):
+                # Values must only depend on the seed, so columns are generated for this object alone
+                return cls._prepare_data(kwargs, [(k, c.generate(1)) for k, c in cls.template().columns], 0,
+                                         stats=stats)
+
+        started = stats.start() if stats is not None else None
+        template = cls.template()
+        cls.validate_data(kwargs)
+
+        data = dict(template.defaults)
+        for k, generator in template.generators:
+            data[k] = generator()
+
+        if columns is None:
+            for k, column in template.columns:
+                if k not in kwargs:
+                    data[k] = column()
+        else:
+            for k, values in columns:
+                data[k] = values[index]
 
         # First apply the user provided data
         data.update(**kwargs)
 
-        # Finally update data with whatever the type handler constructor did
-        # because it might build attributes based on the kwargs
-        data.update(**handler.__dict__)
+        if template.custom_init:
+            # Finally update data with whatever the type handler constructor did
+            # because it might build attributes based on the kwargs
+            data.update(**cls(**kwargs).__dict__)
+
+        if stats is not None:
+            started = stats.lap('defaults', started, 1)
 
         cls._clean_data(data)
         cls._format_data(data)
 
-        return cls._do_create(data)
+        if stats is not None:
+            stats.lap('format', started, 1)
+
+        return data
 
     @classmethod
     def _base_attributes(cls, handler):
@@ -113,7 +436,7 @@ class TypeHandler(object):
 
     @classmethod
     def _parse_date(cls, date_str):
-        return dparse(date_str)
+        return parse_date(date_str, tuple(cls.__date_formats__), cls.__fuzzy_dates__)
 
     @classmethod
     def _format_data(cls, data):
@@ -125,6 +448,22 @@ class TypeHandler(object):
     def _do_create(cls, data):
         raise NotImplementedError
 
+    @classmethod
+    async def _ado_create(cls, data):
+        """
+        Creates the object from an event loop. Handlers can override it or define _do_create
+        as a coroutine, otherwise _do_create is called as is
+        """
+        obj = cls._do_create(data)
+        if inspect.isawaitable(obj):
+            obj = await obj
+
+        return obj
+
+    @classmethod
+    def _do_create_many(cls, data_list):
+        return [cls._do_create(data) for data in data_list]
+
 
 class TypeHandlerLoader(ModuleLoader):
 
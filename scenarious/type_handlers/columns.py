@@ -0,0 +1,190 @@
+import random
+import threading
+from datetime import datetime, date, timedelta
+
+try:
+    import numpy
+
+except ImportError:
+    numpy = None
+
+
+class ColumnGenerator(object):
+    """
+    Generates the values of a handler attribute many at a time. When a handler creates many objects at once
+    (like the ones of ```users: 1000```) every column is generated with a single call, objects created one
+    by one take their values from a buffer that is refilled with a single call as well.
+    """
+
+    buffer_size = 1000
+
+    def __init__(self, buffer_size=None):
+        self.buffer_size = buffer_size or self.buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def generate(self, count):
+        """
+        :param count: number of values to generate
+        :return: list of values
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """
+        Drops the buffered values
+        """
+        with self._lock:
+            self._buffer = []
+
+    def __call__(self):
+        with self._lock:
+            if not self._buffer:
+                self._buffer = self.generate(self.buffer_size)
+                self._buffer.reverse()
+
+            return self._buffer.pop()
+
+
+class IntegerColumn(ColumnGenerator):
+    """
+    Random integers between low and high, both included
+    """
+
+    def __init__(self, low, high, buffer_size=None):
+        super(IntegerColumn, self).__init__(buffer_size)
+        self.low = low
+        self.high = high
+
+    def generate(self, count):
+        if numpy is not None:
+            return numpy.random.randint(self.low, self.high + 1, size=count).tolist()
+
+        return [random.randint(self.low, self.high) for _ in range(count)]
+
+
+class FloatColumn(ColumnGenerator):
+    """
+    Random floats between low and high
+    """
+
+    def __init__(self, low=0.0, high=1.0, buffer_size=None):
+        super(FloatColumn, self).__init__(buffer_size)
+        self.low = low
+        self.high = high
+
+    def generate(self, count):
+        if numpy is not None:
+            return numpy.random.uniform(self.low, self.high, size=count).tolist()
+
+        return [random.uniform(self.low, self.high) for _ in range(count)]
+
+
+class ChoiceColumn(ColumnGenerator):
+    """
+    Random picks from a list of values, optionally weighted
+    """
+
+    def __init__(self, values, weights=None, buffer_size=None):
+        super(ChoiceColumn, self).__init__(buffer_size)
+        self.values = list(values)
+        self.weights = list(weights) if weights else None
+
+    def generate(self, count):
+        if numpy is not None:
+            p = None
+            if self.weights:
+                total = float(sum(self.weights))
+                p = [w / total for w in self.weights]
+
+            return [self.values[i] for i in numpy.random.choice(len(self.values), size=count, p=p).tolist()]
+
+        if self.weights:
+            return random.choices(self.values, weights=self.weights, k=count)
+
+        return [random.choice(self.values) for _ in range(count)]
+
+
+class DateColumn(ColumnGenerator):
+    """
+    Random datetimes between start and end, or dates when start is a date
+    """
+
+    def __init__(self, start, end=None, buffer_size=None):
+        super(DateColumn, self).__init__(buffer_size)
+        self.as_date = isinstance(start, date) and not isinstance(start, datetime)
+        self.start = self._to_datetime(start)
+        self.end = self._to_datetime(end) if end else datetime.now()
+
+    @staticmethod
+    def _to_datetime(value):
+        return value if isinstance(value, datetime) else datetime(value.year, value.month, value.day)
+
+    def generate(self, count):
+        seconds = int((self.end - self.start).total_seconds())
+
+        if numpy is not None:
+            offsets = numpy.random.randint(0, seconds + 1, size=count).tolist()
+        else:
+            offsets = [random.randint(0, seconds) for _ in range(count)]
+
+        values = [self.start + timedelta(seconds=s) for s in offsets]
+        return [v.date() for v in values] if self.as_date else values
+
+
+class FakerColumn(ColumnGenerator):
+    """
+    Values of a faker provider, like FakerColumn('name') or FakerColumn('date_between', start_date='-1y').
+    Faker has no batch API, so by default the provider is still called once per value. With a pool_size, the
+    provider is called pool_size times once and every batch is drawn at random from that pool with a single call,
+    at the cost of values repeating (so it's not fit for unique columns).
+    """
+
+    def __init__(self, provider, *args, **kwargs):
+        super(FakerColumn, self).__init__(kwargs.pop('buffer_size', None))
+        self.faker = kwargs.pop('faker', None)
+        self.pool_size = kwargs.pop('pool_size', None)
+        self.provider = provider
+        self.args = args
+        self.kwargs = kwargs
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _faker(self):
+        if self.faker is not None:
+            return self.faker
+
+        from .base import faker
+        return faker
+
+    def _call_provider(self, count):
+        method, args, kwargs = getattr(self._faker(), self.provider), self.args, self.kwargs
+        return [method(*args, **kwargs) for _ in range(count)]
+
+    def pool(self):
+        """
+        :return: the values batches are drawn from, generated once with a seed of their own so they're the same
+                 in every process and seeded scenarios keep depending on their seed alone
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                fake_random = self._faker().random
+                state = fake_random.getstate()
+                fake_random.seed(repr((self.provider, self.args, sorted(self.kwargs.items()))))
+
+                try:
+                    self._pool = self._call_provider(self.pool_size)
+                finally:
+                    fake_random.setstate(state)
+
+            return self._pool
+
+    def generate(self, count):
+        if not self.pool_size:
+            return self._call_provider(count)
+
+        pool = self.pool()
+        if numpy is not None:
+            return [pool[i] for i in numpy.random.randint(0, len(pool), size=count).tolist()]
+
+        return random.choices(pool, k=count)
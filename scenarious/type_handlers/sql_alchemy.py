@@ -6,52 +6,408 @@ class SQLAlchemyTypeHandlerException(Exception):
     pass
 
 
-class SQLAlchemyTypeHandler(TypeHandler):
+# Open transactions by session
+_transactions = {}
 
-    __model__ = None
 
-    @classmethod
-    def get_attribute_type(cls, attr):
+class SQLAlchemyTransaction(object):
+    """
+    A transaction shared by every handler using the same session while a scenario is built.
+    Objects are added to the session and flushed every flush_every objects or when a
+    reference needs them (to get their primary key), then committed or rolled back once.
+    """
+
+    def __init__(self, session, flush_every=None):
+        self.session = session
+        self.flush_every = flush_every
+        self.handlers = 0
+        self.pending = 0
+        self.failed = False
+
+    def add(self, obj):
+        self.session.add(obj)
+        self.pending += 1
+
+        if self.flush_every and self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.session.flush()
+            self.pending = 0
+
+    def finish(self):
+        if self.failed:
+            self.session.rollback()
+        else:
+            self.session.commit()
+
+
+# Scopes of shared scenarios, by the session of the handlers
+_scopes = {}
+
+
+class SQLAlchemyScope(object):
+    """
+    A connection in a transaction that is never committed, shared by every handler using the same session
+    while a scenario is shared by many tests. The scenario is built within it and every test runs within a
+    savepoint that is rolled back afterwards. Commits of the scope's session only release a savepoint.
+    """
+
+    def __init__(self, session):
+        from sqlalchemy.orm import Session
+
+        self.connection = session.get_bind().connect()
+        self._isolation_level = None
+
+        if self.connection.dialect.name == 'sqlite':
+            # pysqlite only begins transactions before DML statements, so savepoints would commit
+            # what they release. Transactions are begun explicitly instead
+            driver = self.connection.connection.driver_connection
+            self._isolation_level = driver.isolation_level
+            driver.isolation_level = None
+
+        self.transaction = self.connection.begin()
+        if self._isolation_level is not None:
+            self.connection.exec_driver_sql('BEGIN')
+
+        self.session = Session(bind=self.connection, join_transaction_mode='create_savepoint')
+        self.handlers = 0
+        self.savepoint = None
+
+    def begin_test(self):
+        if self.savepoint is None:
+            self.savepoint = self.connection.begin_nested()
+
+    def end_test(self):
+        # Objects are loaded again by every test, from the rolled back state
+        self.session.close()
+
+        if self.savepoint is not None:
+            if self.savepoint.is_active:
+                self.savepoint.rollback()
+            self.savepoint = None
+
+    def close(self):
+        self.end_test()
+        self.transaction.rollback()
+
+        if self._isolation_level is not None:
+            self.connection.connection.driver_connection.isolation_level = self._isolation_level
+
+        self.connection.close()
+
+
+class ModelInfo(object):
+    """
+    Introspection data of a handler's model: columns, their python types and the attribute names
+    the handler accepts. Computed once so formatting and validating rows are just set lookups.
+    """
+
+    def __init__(self, handler):
+        from sqlalchemy import inspect
+
+        self.model = handler.__model__
+        self.columns = set()
+        self._attribute_types = {}
+
+        for prop in inspect(self.model).column_attrs:
+            self.columns.add(prop.key)
+            self._attribute_types[prop.key] = self._python_type(prop.columns[0])
+
+        self.datetime_attributes = set(k for k, t in self._attribute_types.items() if t in (datetime, date))
+
+        self.allowed_attributes = set(dir(self.model))
+        self.allowed_attributes.update(self.model.__dict__)
+        self.allowed_attributes.update(handler._base_attributes(handler))
+        self.allowed_attributes.update(handler.requirements())
+
+    @staticmethod
+    def _python_type(column):
+        try:
+            return column.type.python_type
+        except (AttributeError, NotImplementedError):
+            return None
+
+    def get_attribute_type(self, attr):
+        if attr not in self._attribute_types:
+            # Not a mapped column, it might still be some other kind of model attribute
+            self._attribute_types[attr] = self._inspect_attribute_type(attr)
+
+        return self._attribute_types[attr]
+
+    def _inspect_attribute_type(self, attr):
         from sqlalchemy.orm.attributes import InstrumentedAttribute
         from sqlalchemy.orm.properties import ColumnProperty
 
-        attr_type = None
-        attr = getattr(cls.__model__, attr)
+        attr = getattr(self.model, attr, None)
 
         if hasattr(attr, 'type'):
-            attr_type = attr.type.python_type
+            return self._python_type(attr)
 
-        elif isinstance(attr, InstrumentedAttribute):
-            attr_type = attr.property.columns[0].type.python_type
+        elif isinstance(attr, InstrumentedAttribute) and hasattr(attr.property, 'columns'):
+            return self._python_type(attr.property.columns[0])
 
         elif isinstance(attr, ColumnProperty):
-            attr_type = attr.columns[0].type.python_type
+            return self._python_type(attr.columns[0])
+
+        return None
+
+
+class SQLAlchemyTypeHandler(TypeHandler):
+
+    __model__ = None
+    __session__ = None
+
+    # When enabled, objects of the same type are inserted in chunks through the handler's session
+    __bulk__ = False
+    __bulk_chunk_size__ = 1000
+
+    # When enabled, the whole scenario is built in a single transaction of the handler's session
+    # instead of relying on the model's create
+    __transactional__ = False
+    __flush_every__ = 1000
+
+    @classmethod
+    def get_session(cls):
+        if cls.__session__ is None:
+            raise SQLAlchemyTypeHandlerException("{} has no session defined".format(cls.__name__))
+
+        return cls.__session__
+
+    @classmethod
+    def bind_session(cls, session):
+        """
+        Makes the handler use another session from now on, like one of a copy of the database
+        :return: the session used so far
+        """
+        previous = cls.__session__
+        cls.__session__ = session
+        return previous
+
+    @classmethod
+    def get_transaction(cls):
+        """
+        :return: the SQLAlchemyTransaction of the build in progress, None if not in a transactional build
+        """
+        if not cls.__transactional__:
+            return None
+
+        return _transactions.get(id(cls.get_session()))
+
+    @classmethod
+    def begin_build(cls):
+        if cls.__transactional__:
+            session = cls.get_session()
+            transaction = _transactions.setdefault(
+                id(session), SQLAlchemyTransaction(session, cls.__flush_every__))
+            transaction.handlers += 1
 
-        return attr_type
+    @classmethod
+    def end_build(cls, error=None):
+        transaction = cls.get_transaction()
+        if transaction:
+            transaction.failed = transaction.failed or error is not None
+            transaction.handlers -= 1
+
+            if not transaction.handlers:
+                _transactions.pop(id(transaction.session))
+                transaction.finish()
+
+    @classmethod
+    def begin_scope(cls):
+        """
+        Binds the handler to the SQLAlchemyScope of its session, created by the first handler using it.
+        Many shared scenarios can use the same one, so every shared scenario keeps what it got.
+        :return: (SQLAlchemyScope, the session used so far)
+        """
+        session = cls.get_session()
+        scope = _scopes.get(id(session))
+        if scope is None:
+            scope = _scopes[id(session)] = SQLAlchemyScope(session)
+
+        scope.handlers += 1
+        return scope, cls.bind_session(scope.session)
+
+    @classmethod
+    def begin_test(cls, scope=None):
+        if scope is not None:
+            cls.bind_session(scope[0].session)
+            scope[0].begin_test()
+
+    @classmethod
+    def end_test(cls, scope=None):
+        # Handlers are only bound to the scope while its tests run, so other tests are not affected
+        if scope is not None:
+            scope[0].end_test()
+            cls.bind_session(scope[1])
+
+    @classmethod
+    def is_scoped(cls, obj, scope=None):
+        from sqlalchemy.orm import object_session
+
+        return scope is None or object_session(obj) is scope[0].session
+
+    @classmethod
+    def end_scope(cls, scope=None):
+        if scope is None:
+            return
+
+        scope, session = scope
+        cls.bind_session(session)
+
+        scope.handlers -= 1
+        if not scope.handlers:
+            _scopes.pop(id(session), None)
+            scope.close()
+
+    @classmethod
+    def on_reference(cls, obj, attrs):
+        from sqlalchemy import inspect
+
+        transaction = cls.get_transaction()
+        if transaction and attrs and inspect(obj).pending:
+            transaction.flush()
+
+    @classmethod
+    def get_key_attribute(cls):
+        from sqlalchemy import inspect
+
+        # Composite primary keys can't be assigned a single id
+        mapper = inspect(cls.__model__)
+        if len(mapper.primary_key) != 1:
+            return None
+
+        return mapper.get_property_by_column(mapper.primary_key[0]).key
+
+    @classmethod
+    def prepare_keys(cls, objs):
+        from sqlalchemy import inspect
+
+        if any(inspect(obj).pending for obj in objs):
+            # A single flush for the whole batch, instead of one per object when its key is taken
+            transaction = cls.get_transaction()
+            if transaction:
+                transaction.flush()
+            else:
+                cls.get_session().flush()
+
+    @classmethod
+    def get_key(cls, obj):
+        from sqlalchemy import inspect
+
+        state = inspect(obj)
+        if state.pending:
+            # The primary key is only known once the object is flushed
+            cls.get_session().flush()
+
+        return state.identity
+
+    @classmethod
+    def load(cls, key):
+        return cls.get_session().get(cls.__model__, key)
+
+    @classmethod
+    def model_info(cls):
+        """
+        Gets the introspection data of the handler's model, computed once per handler class
+        :return: ModelInfo
+        """
+        info = cls.__dict__.get('__model_info__')
+
+        if info is None:
+            info = ModelInfo(cls)
+            cls.__model_info__ = info
+
+        return info
+
+    @classmethod
+    def get_attribute_type(cls, attr):
+        return cls.model_info().get_attribute_type(attr)
 
     @classmethod
     def _is_datetime_attribute(cls, attr):
-        return cls.get_attribute_type(attr) in [datetime, date]
+        return cls.get_attribute_type(attr) in (datetime, date)
 
     @classmethod
     def _clean_data(cls, data):
-        required_fields = cls.requirements()
-        base_attrs = cls._base_attributes(cls)
+        allowed_attributes = cls.model_info().allowed_attributes
 
-        for k in data.keys():
+        for k in list(data.keys()):
             if k.startswith('__'):
                 data.pop(k)
 
-            elif not hasattr(cls.__model__, k) \
-               and k not in cls.__model__.__dict__ \
-               and k not in base_attrs \
-               and k not in required_fields:
+            elif k not in allowed_attributes:
                 raise SQLAlchemyTypeHandlerException("'{}' is not a required attribute nor an attribute from '{}'"
-                                                     .format(k, cls.__model__.__class__.__name__))
+                                                     .format(k, cls.__model__.__name__))
 
     @classmethod
     def _do_create(cls, data):
-        return cls.__model__.create(**data)
+        transaction = cls.get_transaction()
+        if not transaction:
+            return cls.__model__.create(**data)
+
+        obj = cls.__model__(**data)
+        transaction.add(obj)
+        return obj
+
+    @classmethod
+    def _do_create_many(cls, data_list):
+        """
+        Bulk handlers insert each chunk at once instead of calling _do_create for every object,
+        so a custom _do_create is skipped by them
+        """
+        if not cls.__bulk__:
+            return super(SQLAlchemyTypeHandler, cls)._do_create_many(data_list)
+
+        transaction = cls.get_transaction()
+        session = cls.get_session()
+        objects = []
+
+        if transaction:
+            transaction.flush()
+
+        for start in range(0, len(data_list), cls.__bulk_chunk_size__):
+            objects.extend(cls._insert_chunk(session, data_list[start:start + cls.__bulk_chunk_size__]))
+
+        if not transaction:
+            session.commit()
+
+        return objects
+
+    @classmethod
+    def _insert_chunk(cls, session, chunk):
+        """
+        Inserts a chunk with a single INSERT ... RETURNING statement when the rows returned can be matched
+        with the chunk: the database sorts them (using a sentinel column) or they can be sorted by an
+        autoincrement primary key. Otherwise, or if there are values for anything but columns (like
+        relationships), objects are added to the session and flushed at once.
+        :return: the objects created, in the order of the chunk
+        """
+        from sqlalchemy import insert, inspect
+        from sqlalchemy.sql.compiler import InsertmanyvaluesSentinelOpts
+
+        mapper = inspect(cls.__model__)
+        sentinel = session.get_bind().dialect.insertmanyvalues_implicit_sentinel & \
+            InsertmanyvaluesSentinelOpts.ANY_AUTOINCREMENT
+        pk = mapper.get_property_by_column(mapper.primary_key[0]).key if len(mapper.primary_key) == 1 else None
+        columns = cls.model_info().columns
+
+        if all(columns.issuperset(data) for data in chunk):
+            if sentinel:
+                statement = insert(cls.__model__).returning(cls.__model__, sort_by_parameter_order=True)
+                return session.scalars(statement, chunk).all()
+
+            if pk and mapper.primary_key[0].autoincrement in (True, 'auto') and \
+                    cls.get_attribute_type(pk) is int and not any(pk in data for data in chunk):
+                # Rows inserted by a single statement get increasing primary keys, in the order of the chunk
+                objects = session.scalars(insert(cls.__model__).returning(cls.__model__), chunk).all()
+                return sorted(objects, key=lambda obj: getattr(obj, pk))
+
+        objects = [cls.__model__(**data) for data in chunk]
+        session.add_all(objects)
+        session.flush()
+        return objects
 
 
 class SQLAlchemyTypeHandlerLoader(TypeHandlerLoader):
@@ -1,7 +1,8 @@
 import os
 import sys
-import imp
 import inspect
+import importlib.util
+import threading
 from collections import OrderedDict
 
 
@@ -28,6 +29,45 @@ class DictObject(dict):
             raise AttributeError("%s doesn't have attribute '%s'" % (self.__class__.__name__, key))
 
 
+class LRUCache(object):
+    """
+    A dict like cache that keeps at most max_size entries, dropping the least recently used ones
+    """
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+
+            except KeyError:
+                return default
+
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
 def module_path(module_name, *args):
     if isinstance(module_name, str) and '.py' in module_name:
         path = os.path.realpath(module_name)
@@ -43,6 +83,17 @@ def module_dir(module_name):
     return os.path.dirname(module_path(module_name))
 
 
+def load_source(module_name, path):
+    """
+    Imports the python file at path as module_name, like the imp.load_source removed in python 3.12
+    """
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
 class ModuleLoader(object):
     """
     Loads all modules inside a folder
@@ -79,7 +130,7 @@ class ModuleLoader(object):
                         if module_name != '__init__' and module_ext == 'py':
                             submodule_path = os.path.join(path, subfile)
                             if submodule_path not in loaded_files:
-                                module = imp.load_source(module_name, submodule_path)
+                                module = load_source(module_name, submodule_path)
 
                                 for member_name, obj in inspect.getmembers(module):
                                     if cls.is_allowed_class(obj):
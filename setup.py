@@ -35,7 +35,8 @@ setup(
         'scenarious': 'scenarious',
         'scenarious.type_handlers': 'scenarious/type_handlers',
     },
-    packages=find_packages(exclude=('tests', 'tests.*')),
+    python_requires='>=3.8',
+    packages=find_packages(exclude=('tests', 'tests.*', 'benchmarks', 'benchmarks.*')),
     include_package_data=True,
     test_suite='tests',
     keywords="unittest fixture scenario",
@@ -45,9 +46,11 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
 )
@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 from scenarious.testing import scenario, ScenariousBaseTest
 from tests.test_scenarious import ActorTypeHandler
@@ -37,6 +38,15 @@ class ScenariousFixtureWithTestClassTest(unittest.TestCase, ScenariousBaseTest):
         assert "test" == self.actors[0].name
         assert "test2" == self.actors[1].name
 
+    @scenario(scenario_a, handlers=[ActorTypeHandler])
+    def test_update_scenario(self):
+        first = self.actors[0]
+        self.update_scenario(self.scenario_b)
+
+        assert 2 == len(self.actors)
+        assert first is self.actors[0]
+        assert "test2" == self.actors[1].name
+
 
 class ScenariousFixtureWithoutTestClassTest(unittest.TestCase):
 
@@ -53,3 +63,40 @@ class ScenariousFixtureWithoutTestClassTest(unittest.TestCase):
         assert 2 == len(scenario.actors)
         assert "test" == scenario.actors[0].name
         assert "test2" == scenario.actors[1].name
+
+
+class AsyncActorTypeHandler(ActorTypeHandler):
+
+    @classmethod
+    async def _do_create(cls, data):
+        await asyncio.sleep(0)
+        return super(AsyncActorTypeHandler, cls)._do_create(data)
+
+
+class AsyncScenariousFixtureTest(unittest.IsolatedAsyncioTestCase, ScenariousBaseTest):
+
+    @scenario("""
+      actors:
+        - name: test
+          age: 20
+
+        - id: 2
+          name: test2
+          age: 22
+    """, handlers=[AsyncActorTypeHandler], concurrency=2)
+    async def test_fixture_with_test_class(self):
+        assert 2 == len(self.actors)
+        assert "test" == self.actors[0].name
+        assert "test2" == self.actors[1].name
+
+
+class AsyncScenariousFixtureWithoutTestClassTest(unittest.IsolatedAsyncioTestCase):
+
+    @scenario("""
+      actors:
+        - name: test
+          age: 20
+    """, handlers=[AsyncActorTypeHandler])
+    async def test_fixture(self, scenario):
+        assert 1 == len(scenario.actors)
+        assert "test" == scenario.actors[0].name
@@ -1,4 +1,4 @@
-from scenarious.util import ModuleLoader
+from scenarious.util import ModuleLoader, load_source
 
 
 def test_module_loader_load_empty():
@@ -18,4 +18,11 @@ def test_module_loader_invalid_paths():
 def test_module_loader_valid_paths():
     actual = ModuleLoader.load(paths=["test.py"])
     expected = []
-    assert actual == expected
\ No newline at end of file
+    assert actual == expected
+
+def test_load_source(tmp_path):
+    path = tmp_path / 'loaded_handlers.py'
+    path.write_text(u'VALUE = 42\n')
+
+    module = load_source('loaded_handlers', str(path))
+    assert 42 == module.VALUE
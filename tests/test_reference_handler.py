@@ -0,0 +1,47 @@
+import unittest
+
+from scenarious.util import DictObject
+from scenarious.reference_handler import ReferenceHandler, ReferenceException
+
+
+class ReferenceHandlerTest(unittest.TestCase):
+
+    def test_compile_reference(self):
+        ref = ReferenceHandler.compile('$tv_show_1.actor.name')
+
+        assert ref is ReferenceHandler.compile('$tv_show_1.actor.name')
+        assert 'tv_show' == ref.type_name
+        assert '1' == ref.id
+        assert ('actor', 'name') == ref.attrs
+        assert not ref.is_alias
+        assert 'test' == ref.resolve(DictObject(actor=DictObject(name='test')))
+
+        ref = ReferenceHandler.compile('$actor_main')
+        assert ref.is_alias
+        assert ref.getter is None
+
+        assert ('actor', 'main', []) == ReferenceHandler.parse('$actor_main')
+
+    def test_invalid_reference(self):
+        self.assertRaises(ReferenceException, ReferenceHandler.compile, 1)
+
+    def test_find_references(self):
+        skipped = []
+        refs = ReferenceHandler.find_references({
+            'title': 'test',
+            'actor': '$actor_1',
+            'actors': ['$actor_2', 'not a reference', {'role': '$role_1.name'}],
+            'details': {'genre': '$genre_drama'},
+            'cast': [['$actor_4', ['$actor_5']]],
+            '_add_actor': '$actor_3',
+        }, skip_key=lambda k: k.startswith('_'), skipped=skipped)
+
+        assert {
+            ('actor',): '$actor_1',
+            ('actors', 0): '$actor_2',
+            ('actors', 2, 'role'): '$role_1.name',
+            ('details', 'genre'): '$genre_drama',
+            ('cast', 0, 0): '$actor_4',
+            ('cast', 0, 1, 0): '$actor_5',
+        } == dict((path, ref.raw) for path, ref in refs)
+        assert [(('_add_actor',), '$actor_3')] == skipped
@@ -0,0 +1,106 @@
+import gc
+import unittest
+
+from scenarious import Scenario, TypeHandler
+from scenarious.util import DictObject
+from scenarious.store_handler import EntityStore
+from scenarious.retention import RetentionException, EvictAfterLastReference, Key, get_retention_policy
+
+
+class AuthorTypeHandler(TypeHandler):
+    __type_name__ = 'author'
+
+    name = 'anonymous'
+
+    # Stands in for a database, so objects can be loaded back by key
+    rows = {}
+
+    @classmethod
+    def _do_create(cls, data):
+        obj = DictObject(**data)
+        cls.rows[id(obj)] = obj
+        return obj
+
+    @classmethod
+    def get_key(cls, obj):
+        return id(obj)
+
+    @classmethod
+    def load(cls, key):
+        return cls.rows[key]
+
+
+class BookTypeHandler(TypeHandler):
+    __type_name__ = 'book'
+    __requires__ = ['author']
+
+    created = []
+
+    @classmethod
+    def _do_create(cls, data):
+        obj = DictObject(**data)
+        cls.created.append(obj)
+        return obj
+
+
+class RetentionTest(unittest.TestCase):
+
+    definition = {
+        'authors': [{'name': 'first'}, {'name': 'second', '_alias': 'second'}, {'name': 'third'}],
+        'books': [{'author': '$author_1'}, {'author': '$author_second.name'}, {'author': '$author_1'}]
+    }
+
+    def setUp(self):
+        AuthorTypeHandler.rows.clear()
+        del BookTypeHandler.created[:]
+
+    def load(self, retention):
+        return Scenario.load(self.definition, type_handlers=[AuthorTypeHandler, BookTypeHandler],
+                             retention=retention)
+
+    def test_full_retention_by_default(self):
+        s = Scenario.load(self.definition, type_handlers=[AuthorTypeHandler, BookTypeHandler])
+
+        assert 3 == len(s.authors)
+        assert s.books[0].author is s.authors.author_1
+
+    def test_invalid_retention(self):
+        self.assertRaises(RetentionException, get_retention_policy, 'everything')
+        assert isinstance(get_retention_policy('evict_after_last_reference'), EvictAfterLastReference)
+
+    def test_keys_retention(self):
+        s = self.load('keys')
+
+        assert all(isinstance(k, Key) for k in s._entity_store._objects['author'].values())
+        assert 'second' == s.authors.author_second.name
+        assert 'third' == s.authors[2].name
+        # Books can't be loaded by key, so they are kept as they are
+        assert 'second' == s.books[1].author
+
+    def test_keys_retention_needs_a_scenario(self):
+        self.assertRaises(RetentionException, EntityStore(retention='keys').add, object(), 'author')
+
+    def test_weak_retention(self):
+        s = self.load('weak')
+
+        assert 3 == len(s.authors)
+        author = s.authors.author_1
+        assert author is s.books[0].author
+
+        AuthorTypeHandler.rows.clear()
+        gc.collect()
+
+        # Books still hold the first author, nothing holds the third one anymore
+        assert author is s.authors.author_1
+        assert s.authors.author_3 is None
+
+    def test_evict_after_last_reference(self):
+        s = self.load('evict_after_last_reference')
+        first, second, third = BookTypeHandler.created[-3:]
+
+        assert 'first' == first.author.name
+        assert first.author is third.author
+        assert 'second' == second.author
+        # Every reference to the authors was resolved and nothing references books, so nothing is kept
+        assert 0 == len(s.authors)
+        assert 0 == len(s.books)
@@ -1,3 +1,9 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import asyncio
 import unittest
 from uuid import uuid4
 from random import randint
@@ -10,6 +16,9 @@ except ImportError:
 from scenarious.util import DictObject
 from scenarious.store_handler import EntityStoreException
 from scenarious.type_handlers.base import faker, TypeHandlerException
+from scenarious.type_handlers.columns import IntegerColumn
+from scenarious.sharding import ExternalEntity
+from scenarious.compiled import handler_fingerprint
 from scenarious import Scenario, TypeHandler, ScenariousException
 
 
@@ -55,6 +64,19 @@ class GenreTypeHandler(BaseTestTypeHandler):
     name = lambda: faker.random_sample(['drama', 'comedy', 'action'], length=1)[0]
 
 
+class ProcessGenreTypeHandler(GenreTypeHandler):
+
+    pid = lambda: os.getpid()
+
+
+class PersonTypeHandler(BaseTestTypeHandler):
+    __type_name__ = 'person'
+
+    name = lambda: faker.name()
+    age = lambda: randint(1, 99)
+    height = IntegerColumn(150, 200)
+
+
 class ScenariousTest(unittest.TestCase):
 
     def test_load_type(self):
@@ -320,4 +342,436 @@ class ScenariousTest(unittest.TestCase):
         assert 3 == len(s.actors)
         assert 3 == len(s.movies)
 
+    def test_update_built_scenario(self):
+        s = Scenario.load({
+            'persons': 10,
+            'actors': [{'name': 'test'}, {'id': 2, 'name': 'test2'}],
+            'movies': [{'title': 'movie 1', 'genre': 'drama', 'actor': '$actor_1', 'year': 2018}],
+        }, type_handlers=[PersonTypeHandler, ActorTypeHandler, MovieTypeHandler])
+        persons, actors, movies = list(s.persons), list(s.actors), list(s.movies)
+
+        s.update({
+            'persons': 5,
+            'actors': [{'name': 'test3', '_alias': 'new'}],
+            'movies': [{'title': 'movie 2', 'genre': 'drama', 'actor': '$actor_new', 'year': 2018},
+                       {'title': 'movie 3', 'genre': 'drama', 'actor': '$actor_2', 'year': 2018}],
+        })
+        s.build(workers=2)
+
+        # only the new definitions are created, references reach the objects created before
+        assert persons == list(s.persons)[:10] and 15 == len(s.persons)
+        assert actors == list(s.actors)[:2]
+        assert ['test', 'test2', 'test3'] == [a.name for a in s.actors]
+        assert movies == list(s.movies)[:1]
+        assert [s.actors[2], s.actors[1]] == [m.actor for m in s.movies[1:]]
+        assert ['1', '2', '3'] == s.actors.identifiers
+
+        # building again without updating doesn't create anything
+        s.build()
+        assert 15 == len(s.persons) and 3 == len(s.movies)
+
+        # objects added since keep their ids, new definitions can't take them
+        added = s.add_person({'name': 'added'})
+        added_id = s.persons.identifiers[-1]
+        s.update({'persons': 1})
+        self.assertRaises(ScenariousException, s.build)
+        assert added is s.persons['16'] and '16' == added_id == s.persons.identifiers[-1]
+
+    def test_lazy_build(self):
+        created = []
+
+        class CountedPersonTypeHandler(PersonTypeHandler):
+
+            @classmethod
+            def _do_create(cls, data):
+                created.append(data['name'])
+                return super(CountedPersonTypeHandler, cls)._do_create(data)
+
+        source = {
+            'persons': 100,
+            'genres': [{'name': 'drama', '_alias': 'drama'}, {'name': 'comedy'}],
+            'movies': [{'title': '$person_50.name', 'genre': '$genre_drama', 'year': 2018},
+                       {'title': 'other', 'genre': '$genre_2', 'year': 2019}],
+        }
+        s = Scenario.load(source, [CountedPersonTypeHandler, GenreTypeHandler, MovieTypeHandler], lazy=True, seed=1)
+        assert [] == created
+
+        # accessing a movie creates what it references, and nothing else
+        movie = s.movies.movie_1
+        assert 1 == len(created)
+        assert s.persons.person_50.name == movie.title
+        assert s.by_id('genre', 'drama') is movie.genre
+        assert ['1'] == s._entity_store.all('genre').identifiers
+
+        assert s.by_id('persons', 11) is s.persons[10]
+        assert 2 == len(created)
+
+        s.materialize_all()
+        eager = Scenario.load(source, [PersonTypeHandler, GenreTypeHandler, MovieTypeHandler], seed=1)
+
+        assert 100 == len(created)
+        assert [p.name for p in eager.persons] == [p.name for p in s.persons]
+        assert [str(i) for i in range(1, 101)] == s.persons.identifiers
+        assert ['other', s.genres[1]] == [s.movies[1].title, s.movies[1].genre]
+
+    def test_compile_sorts_types_by_references(self):
+        s = Scenario.load(StringIO("""
+        movies:
+          - title: test movie 1
+            genre: drama
+            actor: $actor_2
+            year: 2018
+
+        actors:
+          - name: test
+            age: 20
+
+          - name: test2
+            age: 22
+        """), type_handlers=[ActorTypeHandler, MovieTypeHandler], autobuild=False)
+
+        plan = s.compile()
+        assert ['actor', 'movie'] == plan.type_order
+        assert {'actor'} == plan.type_dependencies['movie']
+        assert [('actor', 1), ('actor', 2), ('movie', 1)] == [(e.type_name, e.identifier) for e in plan]
+
+        s.build()
+        assert 'test2' == s.by_id('movies', 1).actor.name
+
+    def test_compile_honours_load_priority(self):
+        s = Scenario.load(StringIO("""
+        actors:
+          - name: test
+        genres: 1
+        movies:
+          - title: test movie 1
+            genre: $genre_1.name
+            actor: $actor_1
+            year: 2018
+        """), type_handlers=[ActorTypeHandler, MovieTypeHandler, GenreTypeHandler],
+            load_priority=['movies'], autobuild=False)
+
+        # movies go first, so their dependencies go first as well
+        assert ['actor', 'genre', 'movie'] == s.compile().type_order
+
+    def test_compiled_plan_is_reused_between_builds(self):
+        s = Scenario.load(StringIO("""
+        actors:
+          - name: test
+            age: 20
+        movies:
+          - title: test movie 1
+            genre: drama
+            actor: $actor_1
+            year: 2018
+        """), type_handlers=[ActorTypeHandler, MovieTypeHandler])
+
+        plan = s.compile()
+        first_movie = s.movies[0]
+
+        s.reset()
+        s.build()
+
+        assert plan is s.compile()
+        assert 1 == len(s.movies)
+        assert first_movie is not s.movies[0]
+        assert s.actors[0] is s.movies[0].actor
+
+    def test_fail_with_circular_references(self):
+        scene = StringIO("""
+        actors:
+          - name: test
+            age: $movie_1.year
+        movies:
+          - title: test movie 1
+            genre: drama
+            actor: $actor_1
+            year: 2018
+        """)
+        self.assertRaises(ScenariousException, Scenario.load, scene, type_handlers=[ActorTypeHandler, MovieTypeHandler])
+
+    def test_concurrent_build_matches_serial_build(self):
+        lock = threading.Lock()
+        running = [0, 0]  # running now, most running at once
+
+        class SlowActorTypeHandler(ActorTypeHandler):
+
+            @classmethod
+            def _do_create(cls, data):
+                with lock:
+                    running[0] += 1
+                    running[1] = max(running)
+
+                time.sleep(0.02)
+
+                with lock:
+                    running[0] -= 1
+
+                return super(SlowActorTypeHandler, cls)._do_create(data)
+
+        definition = """
+        actors:
+          - name: test1
+          - name: test2
+            _alias: second
+          - id: 1
+            name: test3
+          - name: test4
+            age: $actor_second.age
+""" + "".join("          - name: extra{}\n".format(i) for i in range(10)) + """
+        movies:
+          - title: test movie 1
+            genre: drama
+            actor: $actor_4
+            year: 2018
+          - title: test movie 2
+            genre: drama
+            actor: $actor_second
+            year: 2018
+        """
+
+        serial = Scenario.load(StringIO(definition), type_handlers=[SlowActorTypeHandler, MovieTypeHandler])
+
+        assert 1 == running[1]
+
+        concurrent = Scenario.load(StringIO(definition), type_handlers=[SlowActorTypeHandler, MovieTypeHandler],
+                                   workers=8)
+        assert running[1] > 1
+
+        for type_name in ('actor', 'movie'):
+            serial_objects = serial._entity_store.all(type_name)
+            concurrent_objects = concurrent._entity_store.all(type_name)
+
+            assert serial_objects.identifiers == concurrent_objects.identifiers
+            assert serial_objects.aliases == concurrent_objects.aliases
+            assert [o.get('name', o.get('title')) for o in serial_objects] == \
+                [o.get('name', o.get('title')) for o in concurrent_objects]
+
+        assert 'test4' == concurrent.by_id('movies', 1).actor.name
+        assert 'test2' == concurrent.by_id('movies', 2).actor.name
+        assert concurrent.by_id('actors', 'second').age == concurrent.by_id('actors', 4).age
+
+    def test_async_build(self):
+        running = []
+        max_running = []
+
+        class AsyncActorTypeHandler(ActorTypeHandler):
+
+            @classmethod
+            async def _do_create(cls, data):
+                running.append(1)
+                max_running.append(len(running))
+                await asyncio.sleep(0.01)
+                running.pop()
+                return super(AsyncActorTypeHandler, cls)._do_create(data)
+
+        s = Scenario.load(StringIO("""
+        actors:
+""" + "".join("          - name: actor{}\n".format(i) for i in range(10)) + """
+        movies:
+          - title: test movie 1
+            genre: drama
+            actor: $actor_10
+            year: 2018
+        """), type_handlers=[AsyncActorTypeHandler, MovieTypeHandler], autobuild=False)
+
+        asyncio.run(s.abuild(concurrency=3))
+
+        assert 3 == max(max_running)
+        assert ['actor{}'.format(i) for i in range(10)] == [a.name for a in s.actors]
+        assert 'actor9' == s.by_id('movies', 1).actor.name
+
+    def test_default_definitions_are_not_materialized(self):
+        s = Scenario.load(StringIO("""
+        genres: 3
+        """), [GenreTypeHandler, MovieTypeHandler], autobuild=False)
+        s.update(StringIO("""
+        genres:
+          - name: drama
+            _alias: drama
+        movies:
+          - title: test movie 1
+            genre: $genre_2
+            year: 2018
+          - title: test movie 2
+            genre: $genre_drama
+            year: 2018
+        """))
+
+        assert 3 == len(s._raw_data['genres'][0])
+        assert [(1, 3), (4, 1)] == [(e.identifier, e.count) for e in s.compile() if e.type_name == 'genre']
+
+        s.build()
+        assert 4 == len(s.genres)
+        assert s.genres[1] is s.by_id('movies', 1).genre
+        assert 'drama' == s.by_id('movies', 2).genre.name
+
+    def test_pipeline_build(self):
+        s = Scenario.load(StringIO("""
+        genres: 25
+        movies:
+          - title: test movie 1
+            genre: $genre_17
+            year: 2018
+        """), [ProcessGenreTypeHandler, MovieTypeHandler], autobuild=False)
+        s.chunk_size = 10
+
+        s.build(processes=2)
+
+        assert 25 == len(s.genres)
+        assert ['{}'.format(i) for i in range(1, 26)] == s.genres.identifiers
+        assert s.genres.genre_17 is s.by_id('movies', 1).genre
+        # data was generated by the worker processes
+        assert os.getpid() not in set(g.pid for g in s.genres)
+
+    def test_seeded_builds_are_reproducible(self):
+        def build(seed, chunk_size=1000, **kwargs):
+            s = Scenario.load({'persons': 30, 'genres': [{'name': 'drama'}, {}]},
+                              [PersonTypeHandler, GenreTypeHandler], autobuild=False, seed=seed)
+            s.chunk_size = chunk_size
+            s.build(**kwargs)
+            return [(p.name, p.age, p.height) for p in s.persons] + [g.name for g in s.genres]
+
+        serial = build(7)
+        assert serial == build(7, chunk_size=4, workers=3)
+        assert serial == build(7, chunk_size=8, processes=2)
+        assert serial != build(8)
+
+        s = Scenario.load({'persons': [{}, {}]}, [PersonTypeHandler], autobuild=False, seed=7)
+        asyncio.run(s.abuild())
+        assert serial[:2] == [(p.name, p.age, p.height) for p in s.persons]
+
+    def test_sharded_builds(self):
+        source = {
+            'persons': 10,
+            'movies': [{'title': 'movie {}'.format(i), 'genre': '$person_{}'.format(11 - i * 3), 'year': 2018}
+                       for i in range(1, 4)]
+        }
+
+        def build(shard):
+            s = Scenario.load(source, [PersonTypeHandler, MovieTypeHandler], seed=1, shard=shard)
+            return s, [(p.id, p.name) for p in s.persons], [(m.id, m.title, m.genre) for m in s.movies]
+
+        _, persons, movies = build(None)
+        first, first_persons, first_movies = build((0, 2))
+        second, second_persons, second_movies = build((1, 2))
+
+        # ids are the ones of the whole scenario and are handed over to the handler
+        assert ['1', '2', '3', '4', '5'] == first.persons.identifiers
+        assert [1, 2, 3, 4, 5] == [p for p, _ in first_persons]
+        assert [p[1] for p in persons] == [p[1] for p in first_persons + second_persons]
+        assert [m[1] for m in movies] == [m[1] for m in first_movies + second_movies]
+
+        # references to objects of another shard only know their id
+        assert ExternalEntity('person', 8) == first_movies[0][2]
+        assert 2 == second_movies[-1][2].id
+        self.assertRaises(ScenariousException, getattr, second_movies[-1][2], 'name')
+
+        ranged, ranged_persons, ranged_movies = build({'persons': (4, 8)})
+        assert [4, 5, 6, 7, 8] == [p for p, _ in ranged_persons]
+        assert ranged.persons.person_8 is ranged_movies[0][2]
+        assert ExternalEntity('person', 2) == ranged_movies[-1][2]
+
+    def test_compiled_artifacts(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'scenario.bin')
+
+        source = """
+        persons: 20
+        genres:
+          - name: drama
+            _alias: drama
+          - id: thriller
+            name: thriller
+        movies:
+          - title: $person_3.name
+            genre: $genre_drama
+            year: 2018
+          - id: heat
+            _alias: best
+            title: heat
+            genre: $genre_thriller
+            year: 1995
+        """
+        handlers = [PersonTypeHandler, GenreTypeHandler, MovieTypeHandler]
+
+        def persons(s):
+            return [(p.name, p.age, p.height) for p in s.persons]
+
+        compiled = Scenario.load_compiled(path, StringIO(source), handlers, seed=3)
+        assert os.path.exists(path)
+        assert persons(Scenario.load(StringIO(source), handlers, seed=3)) == persons(compiled)
+
+        loaded = Scenario.load_compiled(path, StringIO(source), handlers, seed=3, stats=True)
+        # nor parsed nor compiled again
+        assert 'parse' not in loaded.build_stats['scenario'].phases
+        assert persons(compiled) == persons(loaded)
+        assert loaded.persons.person_3.name == loaded.movies[0].title
+        assert loaded.genres.genre_drama is loaded.movies[0].genre
+        # custom ids and aliases are kept as they are
+        assert ['1', 'thriller'] == loaded.genres.identifiers
+        assert loaded.genres.genre_thriller is loaded.movies.movie_heat.genre
+        assert loaded.movies.movie_heat is loaded.movies.movie_best
+
+        # the artifact is rebuilt when the source, the handlers or the seed change
+        os.utime(path, (0, 0))
+        Scenario.load_compiled(path, StringIO(source), handlers, seed=3)
+        assert 0 == os.path.getmtime(path)
+
+        for changed_source, changed_handlers, seed in ((source.replace('20', '21'), handlers, 3),
+                                                       (source, handlers + [ActorTypeHandler], 3),
+                                                       (source, handlers, 4)):
+            os.utime(path, (0, 0))
+            s = Scenario.load_compiled(path, StringIO(changed_source), changed_handlers, seed=seed)
+            assert os.path.getmtime(path) > 0
+            assert persons(s)[:20] == persons(loaded) if seed == 3 else persons(s) != persons(loaded)
+
+        loaded.reset()
+        loaded.build()
+        assert persons(compiled) == persons(loaded)
+
+    def test_fingerprint_of_handlers_without_source(self):
+        def handler(name):
+            return type('OnTheFlyTypeHandler', (PersonTypeHandler,), {
+                'name': lambda: faker.name() if name == 'name' else faker.word(),
+                'tags': frozenset(['a', 'b', 'c']),
+                'age': IntegerColumn(18, 80),
+            })
+
+        # memory addresses of functions and objects are left out
+        assert handler_fingerprint(handler('name')) == handler_fingerprint(handler('name'))
+        assert handler_fingerprint(handler('name')) != handler_fingerprint(type(
+            'OnTheFlyTypeHandler', (PersonTypeHandler,), {'name': lambda: faker.word()}))
+
+    def test_streaming_build(self):
+        chunks = []
+        movies = []
+
+        class CollectedMovieTypeHandler(MovieTypeHandler):
+
+            @classmethod
+            def _do_create(cls, data):
+                movies.append(super(CollectedMovieTypeHandler, cls)._do_create(data))
+                return movies[-1]
+
+        class ChunkedGenreTypeHandler(GenreTypeHandler):
+
+            @classmethod
+            def _do_create_many(cls, data_list):
+                chunks.append(len(data_list))
+                return super(ChunkedGenreTypeHandler, cls)._do_create_many(data_list)
+
+        s = Scenario.load(StringIO("""
+        genres: 2500
+        movies:
+          - title: test movie 1
+            genre: $genre_1234
+            year: 2018
+        """), [ChunkedGenreTypeHandler, CollectedMovieTypeHandler], streaming=True)
 
+        assert [1000, 1000, 500] == chunks
+        # only referenced objects are kept
+        assert 1 == len(s.genres)
+        assert not s._entity_store.has_type('movie')
+        assert s.by_id('genres', 1234) is movies[0].genre
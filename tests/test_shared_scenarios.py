@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+
+from scenarious import Scenario, ScenariousException
+from scenarious.testing import scenario, release_scenarios, ScenariousBaseTest, SharedScenario
+from scenarious.type_handlers.sql_alchemy import SQLAlchemyTypeHandler
+
+
+_tmp_dir = tempfile.mkdtemp()
+engine = create_engine('sqlite:///' + os.path.join(_tmp_dir, 'shared.sqlite'))
+session = sessionmaker(bind=engine)()
+Base = declarative_base()
+
+builds = []
+
+
+class Team(Base):
+    __tablename__ = 'teams'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+
+
+class Player(Base):
+    __tablename__ = 'players'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+    team_id = Column(Integer, ForeignKey('teams.id'), nullable=False)
+    team = relationship(Team)
+
+
+class TeamTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'team'
+    __model__ = Team
+    __session__ = session
+    __transactional__ = True
+
+    @classmethod
+    def begin_build(cls):
+        builds.append(cls)
+        super(TeamTypeHandler, cls).begin_build()
+
+
+class CommittingTeamTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'team'
+    __model__ = Team
+    __session__ = session
+
+    @classmethod
+    def _do_create(cls, data):
+        team = Team(**data)
+        session.add(team)
+        session.commit()
+        return team
+
+
+class PlayerTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'player'
+    __model__ = Player
+    __session__ = session
+    __transactional__ = True
+    __requires__ = ['name', 'team_id']
+
+
+SOURCE = """
+teams:
+  - name: boca
+    _alias: boca
+players:
+  - name: riquelme
+    team_id: $team_boca.id
+  - name: palermo
+    team_id: $team_1.id
+"""
+
+
+def setUpModule():
+    Base.metadata.create_all(engine)
+
+
+def tearDownModule():
+    release_scenarios()
+    session.close()
+    engine.dispose()
+    shutil.rmtree(_tmp_dir)
+
+
+class ClassScopedScenarioTest(unittest.TestCase, ScenariousBaseTest):
+
+    @classmethod
+    def setUpClass(cls):
+        del builds[:]
+
+    def _change_everything(self):
+        db = TeamTypeHandler.get_session()
+        assert db is not session
+
+        db.delete(self.players[0])
+        self.team.name = 'river'
+        db.add(Player(name='ortega', team_id=self.team.id))
+        db.commit()
+
+        assert 2 == db.query(Player).count()
+        assert 'river' == db.query(Team).one().name
+
+    def _check_scenario(self):
+        assert [TeamTypeHandler] == builds
+        assert ['riquelme', 'palermo'] == [p.name for p in self.players]
+        assert 'boca' == self.teams.team_boca.name
+        assert self.team is self.players[1].team
+
+    @scenario(SOURCE, handlers=[TeamTypeHandler, PlayerTypeHandler], scope='class')
+    def test_first(self):
+        self._check_scenario()
+        self._change_everything()
+
+    @scenario(SOURCE, handlers=[TeamTypeHandler, PlayerTypeHandler], scope='class')
+    def test_second(self):
+        self._check_scenario()
+        self._change_everything()
+
+    @scenario(SOURCE, handlers=[TeamTypeHandler, PlayerTypeHandler], scope='class')
+    def test_shared_scenarios_cant_be_updated(self):
+        self.assertRaises(ScenariousException, self.update_scenario, 'teams: 1')
+        assert 1 == len(self.teams)
+
+    def test_nothing_is_committed_outside_the_scope(self):
+        assert TeamTypeHandler.get_session() is session
+        assert 0 == session.query(Team).count()
+
+
+class SessionScopedScenarioTest(unittest.TestCase, ScenariousBaseTest):
+
+    scenario_scope = 'session'
+
+    def test_scope_from_the_test_class(self):
+        self.create_scenario(SOURCE, handlers=[TeamTypeHandler, PlayerTypeHandler])
+        assert 2 == len(self.players)
+
+    def test_invalid_scope(self):
+        self.assertRaises(ScenariousException, self.create_scenario, SOURCE, scope='test')
+
+    def test_async_tests_cant_share_scenarios(self):
+        async def test(self):
+            pass
+
+        self.assertRaises(ScenariousException, scenario(SOURCE, scope='module'), test)
+
+
+class MixedScopesTest(unittest.TestCase):
+
+    def setUp(self):
+        release_scenarios()
+
+    def _share(self):
+        shared = SharedScenario(Scenario.load(StringIO(SOURCE), [TeamTypeHandler, PlayerTypeHandler], autobuild=False))
+        shared.build()
+        self.addCleanup(shared.close)
+        return shared
+
+    def test_closing_a_scenario_keeps_the_others_sharing_the_handlers(self):
+        session_scoped = self._share()
+        class_scoped = self._share()
+
+        class_scoped.begin_test()
+        class_scoped.end_test()
+        class_scoped.close()
+
+        session_scoped.begin_test()
+        try:
+            assert TeamTypeHandler.get_session() is not session
+            assert 'boca' == session_scoped.scenario.teams.team_boca.name
+        finally:
+            session_scoped.end_test()
+
+        assert TeamTypeHandler.get_session() is session
+
+    def test_handlers_must_create_objects_within_the_scope(self):
+        def delete_teams():
+            session.query(Team).delete()
+            session.commit()
+
+        self.addCleanup(delete_teams)
+        shared = SharedScenario(Scenario.load(StringIO(SOURCE), [CommittingTeamTypeHandler, PlayerTypeHandler],
+                                              autobuild=False))
+
+        self.assertRaises(ScenariousException, shared.build)
+        assert PlayerTypeHandler.get_session() is session
+        assert 0 == session.query(Player).count()
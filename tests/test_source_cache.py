@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from scenarious.source_cache import SourceCache
+
+
+class SourceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_streams_are_cached_by_content(self):
+        cache = SourceCache()
+
+        first = cache.load(StringIO("actors:\n  - name: test\n    _alias: a\n"))
+        second = cache.load(StringIO("actors:\n  - name: test\n    _alias: a\n"))
+
+        assert 1 == len(cache)
+        assert first == second
+        # every load gets its own copy
+        first['actors'][0].pop('_alias')
+        assert 'a' == second['actors'][0]['_alias']
+        assert 'a' == cache.load(StringIO("actors:\n  - name: test\n    _alias: a\n"))['actors'][0]['_alias']
+
+    def test_files_are_invalidated_when_modified(self):
+        cache = SourceCache()
+        path = os.path.join(self.tmp_dir, 'scenario.yml')
+
+        with open(path, 'w') as f:
+            f.write("actors: 1\n")
+
+        assert {'actors': 1} == cache.load(path)
+
+        with open(path, 'w') as f:
+            f.write("actors: 22\n")
+        os.utime(path, (0, 0))
+
+        assert {'actors': 22} == cache.load(path)
+
+    def test_least_recently_used_sources_are_evicted(self):
+        cache = SourceCache(max_size=2)
+
+        cache.load(StringIO("actors: 1"))
+        cache.load(StringIO("actors: 2"))
+        cache.load(StringIO("actors: 1"))
+        cache.load(StringIO("actors: 3"))
+
+        assert 2 == len(cache)
+        parsed = [cache._cache.get(key) for key in list(cache._cache._data.keys())]
+        assert [{'actors': 1}, {'actors': 3}] == parsed
@@ -0,0 +1,260 @@
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship, scoped_session, sessionmaker
+
+from scenarious import Scenario
+from scenarious.type_handlers.base import faker, TypeHandlerException
+from scenarious.type_handlers.sql_alchemy import SQLAlchemyTypeHandler, SQLAlchemyTypeHandlerException, _transactions
+
+
+engine = create_engine('sqlite://')
+session = scoped_session(sessionmaker(bind=engine))
+Base = declarative_base()
+
+
+class Model(Base):
+    __abstract__ = True
+
+    @classmethod
+    def create(cls, **kwargs):
+        obj = cls(**kwargs)
+        session.add(obj)
+        session.commit()
+        return obj
+
+
+class User(Model):
+    __tablename__ = 'users'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+    created_at = Column(DateTime)
+
+
+class Post(Model):
+    __tablename__ = 'posts'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(64), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user = relationship(User)
+
+
+class Tag(Model):
+    __tablename__ = 'tags'
+
+    code = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+
+
+class PostTag(Model):
+    __tablename__ = 'post_tags'
+
+    post_id = Column(Integer, ForeignKey('posts.id'), primary_key=True)
+    tag_code = Column(Integer, ForeignKey('tags.code'), primary_key=True)
+
+
+class UserTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'user'
+    __model__ = User
+    __session__ = session
+
+    name = lambda: faker.name()
+
+
+class BulkUserTypeHandler(UserTypeHandler):
+    __bulk__ = True
+    __bulk_chunk_size__ = 10
+
+
+class PostTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'post'
+    __model__ = Post
+    __session__ = session
+    __requires__ = ['user_id']
+
+    title = lambda: faker.sentence()
+
+
+class TransactionalUserTypeHandler(UserTypeHandler):
+    __transactional__ = True
+    __flush_every__ = 10
+
+
+class TransactionalPostTypeHandler(PostTypeHandler):
+    __transactional__ = True
+    __flush_every__ = 10
+
+
+class UnavailablePostTypeHandler(TransactionalPostTypeHandler):
+
+    @classmethod
+    def begin_build(cls):
+        raise SQLAlchemyTypeHandlerException('database unavailable')
+
+
+class TagTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'tag'
+    __model__ = Tag
+    __session__ = session
+
+    name = lambda: faker.word()
+
+
+class PostTagTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'post_tag'
+    __model__ = PostTag
+    __session__ = session
+    __requires__ = ['post_id', 'tag_code']
+
+
+class SQLAlchemyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Base.metadata.create_all(engine)
+        self.inserts = []
+        self.commits = []
+        event.listen(engine, 'before_cursor_execute', self._track_inserts)
+        event.listen(engine, 'commit', self._track_commits)
+
+    def tearDown(self):
+        event.remove(engine, 'before_cursor_execute', self._track_inserts)
+        event.remove(engine, 'commit', self._track_commits)
+        session.remove()
+        Base.metadata.drop_all(engine)
+
+    def _track_inserts(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT'):
+            self.inserts.append(executemany)
+
+    def _track_commits(self, conn):
+        self.commits.append(conn)
+
+
+class SQLAlchemyTypeHandlerTest(SQLAlchemyTestCase):
+
+    def test_create_one_by_one(self):
+        s = Scenario.load({'users': 3}, type_handlers=[UserTypeHandler])
+
+        assert 3 == session.query(User).count()
+        assert [False, False, False] == self.inserts
+        assert 3 == len(self.commits)
+        assert [1, 2, 3] == [s.users[i].id for i in range(3)]
+
+    def test_bulk_create(self):
+        s = Scenario.load({'users': 25, 'posts': [{'user_id': '$user_25.id'}, {'user_id': '$user_3.id'}]},
+                          type_handlers=[BulkUserTypeHandler, PostTypeHandler])
+
+        assert 25 == session.query(User).count()
+        # users are inserted with a statement per chunk and committed once, posts are created one by one
+        assert 3 + 2 == len(self.inserts)
+        assert 3 == len(self.commits)
+
+        assert 25 == s.by_id('users', 25).id
+        assert s.by_id('users', 25) is s.by_id('posts', 1).user
+        assert s.by_id('users', 3) is s.by_id('posts', 2).user
+
+    def test_transactional_build_commits_once(self):
+        s = Scenario.load({'users': 25, 'posts': [{'user_id': '$user_3.id'}, {'user_id': '$user_25.id'}]},
+                          type_handlers=[TransactionalUserTypeHandler, TransactionalPostTypeHandler])
+
+        assert 1 == len(self.commits)
+        assert 25 == session.query(User).count()
+        assert 2 == session.query(Post).count()
+        assert s.by_id('users', 25) is s.by_id('posts', 2).user
+
+    def test_transactional_build_flushes_when_a_reference_needs_it(self):
+        flushes = []
+
+        def track_flush(*args):
+            flushes.append(args)
+
+        event.listen(session, 'after_flush', track_flush)
+        try:
+            Scenario.load({'users': 3, 'posts': [{'user_id': '$user_1.id'}]},
+                          type_handlers=[TransactionalUserTypeHandler, TransactionalPostTypeHandler])
+        finally:
+            event.remove(session, 'after_flush', track_flush)
+
+        # one flush for the referenced user and a last one when committing
+        assert 2 == len(flushes)
+
+    def test_transactional_build_rolls_back_on_error(self):
+        self.assertRaises(TypeHandlerException, Scenario.load, {'users': 25, 'posts': [{'title': 'no user'}]},
+                          type_handlers=[TransactionalUserTypeHandler, TransactionalPostTypeHandler])
+
+        assert 0 == len(self.commits)
+        assert 0 == session.query(User).count()
+
+    def test_builds_begun_are_ended_when_another_handler_fails_to_begin(self):
+        self.assertRaises(SQLAlchemyTypeHandlerException, Scenario.load, {'users': 2, 'posts': 1},
+                          type_handlers=[TransactionalUserTypeHandler, UnavailablePostTypeHandler])
+
+        assert {} == _transactions
+        assert 0 == len(self.commits)
+
+    def test_model_info(self):
+        info = UserTypeHandler.model_info()
+
+        assert info is UserTypeHandler.model_info()
+        assert {'id', 'name', 'created_at'} == info.columns
+        assert {'created_at'} == info.datetime_attributes
+        assert datetime == UserTypeHandler.get_attribute_type('created_at')
+        assert UserTypeHandler.get_attribute_type('create') is None
+
+    def test_format_and_validate_data(self):
+        s = Scenario.load({'users': [{'name': 'test', 'created_at': '2018-05-01 10:30'}]},
+                          type_handlers=[UserTypeHandler])
+
+        assert datetime(2018, 5, 1, 10, 30) == s.users[0].created_at
+
+        self.assertRaises(SQLAlchemyTypeHandlerException, UserTypeHandler.create, name='test', nickname='t')
+
+    def test_keys_retention(self):
+        s = Scenario.load({'users': 3, 'posts': [{'user_id': '$user_2.id'}]},
+                          type_handlers=[TransactionalUserTypeHandler, TransactionalPostTypeHandler], retention='keys')
+
+        assert (2,) == s._entity_store._objects['user'][2].value
+        session.expunge_all()
+
+        user = s.users.user_2
+        assert isinstance(user, User) and 2 == user.id
+        assert 2 == s.posts[0].user_id
+
+    def test_keys_retention_flushes_once_per_batch(self):
+        flushes = []
+
+        def track_flush(*args):
+            flushes.append(args)
+
+        event.listen(session, 'after_flush', track_flush)
+        try:
+            Scenario.load({'users': 25}, type_handlers=[TransactionalUserTypeHandler], retention='keys')
+        finally:
+            event.remove(session, 'after_flush', track_flush)
+
+        # every 10 objects and once for the last 5, before their keys are taken
+        assert 3 == len(flushes)
+
+    def test_sharded_builds_assign_the_primary_key(self):
+        assert 'code' == TagTypeHandler.get_key_attribute()
+        assert PostTagTypeHandler.get_key_attribute() is None
+
+        s = Scenario.load({'users': 1, 'posts': [{'user_id': '$user_1.id'}], 'tags': 4,
+                           'post_tags': [{'post_id': '$post_1.id', 'tag_code': '$tag_4.code'}]},
+                          type_handlers=[UserTypeHandler, PostTypeHandler, TagTypeHandler, PostTagTypeHandler],
+                          shard={'tags': (3, 4)})
+
+        assert [3, 4] == [t.code for t in s.tags]
+        assert (1, 4) == (s.post_tags[0].post_id, s.post_tags[0].tag_code)
+
+    def test_references_to_other_shards_by_key_attribute(self):
+        s = Scenario.load({'users': 1, 'posts': [{'user_id': '$user_1.id'}], 'tags': 4,
+                           'post_tags': [{'post_id': '$post_1.id', 'tag_code': '$tag_4.code'}]},
+                          type_handlers=[UserTypeHandler, PostTypeHandler, TagTypeHandler, PostTagTypeHandler],
+                          shard={'tags': (1, 2)})
+
+        assert [1, 2] == [t.code for t in s.tags]
+        assert 4 == s.post_tags[0].tag_code
@@ -0,0 +1,81 @@
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from scenarious import Scenario, testing
+from scenarious.stats import BuildStats, SCENARIO
+from scenarious.testing import ScenariousBaseTest, enable_stats, aggregate_stats
+from tests.test_scenarious import ActorTypeHandler, MovieTypeHandler, GenreTypeHandler
+
+
+class StatTypeHandler(GenreTypeHandler):
+    __type_name__ = 'stat'
+
+
+class BuildStatsTest(unittest.TestCase):
+
+    source = """
+    genres: 5
+    actors:
+      - name: test
+    movies:
+      - title: test movie
+        genre: $genre_2.name
+        actor: $actor_1
+        year: 2018
+    """
+
+    def tearDown(self):
+        testing._aggregate_stats = None
+
+    def test_disabled_by_default(self):
+        s = Scenario.load(StringIO(self.source), [ActorTypeHandler, MovieTypeHandler, GenreTypeHandler])
+        assert s.build_stats is None
+
+    def test_stats_by_type_and_phase(self):
+        s = Scenario.load(StringIO(self.source), [ActorTypeHandler, MovieTypeHandler, GenreTypeHandler], stats=True)
+        stats = s.build_stats.as_dict()
+
+        assert ['parse', 'compile', 'build'] == list(stats[SCENARIO]['phases'])
+        assert {'defaults', 'format', 'create'} == set(stats['genre']['phases']) - {'resolve'}
+        assert 5 == stats['genre']['phases']['create']['objects']
+        assert 5 == stats['genre']['phases']['format']['calls']
+        assert 1 == stats['genre']['phases']['resolve']['objects']
+        assert 1 == stats['actor']['phases']['resolve']['objects']
+        assert 1 == stats['movie']['phases']['create']['objects']
+
+        table = s.build_stats.table().splitlines()
+        assert ['type', 'phase', 'calls', 'objects', 'wall', '(s)', 'cpu', '(s)'] == table[0].split()
+        assert any(row.split()[:2] == ['genre', 'create'] for row in table)
+
+    def test_types_named_stat_are_still_accessible(self):
+        s = Scenario.load({'stats': 2}, [StatTypeHandler], stats=True)
+
+        assert 2 == len(s.stats)
+        assert 2 == s.build_stats.as_dict()['stat']['phases']['create']['objects']
+
+    def test_merge(self):
+        stats = BuildStats()
+        stats.for_type('user').record('create', 1.0, 0.5, objects=10)
+        stats.count('user', 'queries', 3)
+
+        total = BuildStats()
+        total.merge(stats)
+        total.merge(stats)
+
+        assert {'calls': 2, 'objects': 20, 'wall': 2.0, 'cpu': 1.0} == dict(total['user'].phases['create'].as_dict())
+        assert 6 == total['user'].counters['queries']
+
+    def test_aggregate_stats_of_test_scenarios(self):
+        assert aggregate_stats() is None
+        stats = enable_stats()
+
+        ScenariousBaseTest.build_scenario(self.source, handlers=[ActorTypeHandler, MovieTypeHandler, GenreTypeHandler])
+        ScenariousBaseTest.build_scenario("genres: 2", handlers=[GenreTypeHandler])
+
+        assert stats is aggregate_stats()
+        assert 2 == stats[SCENARIO].counters['scenarios']
+        assert 7 == stats['genre'].phases['create'].objects
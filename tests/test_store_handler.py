@@ -0,0 +1,59 @@
+import unittest
+
+from scenarious.store_handler import EntityStore, EntityStoreException, EntityID
+
+
+class EntityManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = EntityStore()
+        for i in range(5):
+            self.store.add('user {}'.format(i + 1), type_name='user')
+
+        self.store.add('aliased user', type_name='user', entity_id=EntityID(alias='admin'))
+        self.store.add('a product', type_name='product_item')
+
+    def test_access_by_identifier_and_alias(self):
+        users = self.store.all('user')
+
+        assert 'user 3' == users.user_3
+        assert 'aliased user' == users.user_6
+        assert 'aliased user' == users.user_admin
+        assert 'user 3' == users['3']
+        assert 'aliased user' == users['admin']
+        assert 'user 1' == users[0]
+
+        self.assertRaises(EntityStoreException, getattr, users, 'user_99')
+        self.assertRaises(EntityStoreException, getattr, users, 'product_1')
+        self.assertRaises(EntityStoreException, users.__getitem__, 99)
+
+    def test_type_names_with_underscores(self):
+        assert 'a product' == self.store.all('product_item').product_item_1
+
+    def test_iterate_objects(self):
+        assert ['user 1', 'user 2', 'user 3', 'user 4', 'user 5', 'aliased user'] == list(self.store.all('user'))
+
+    def test_objects_are_a_copy(self):
+        users = self.store.all('user')
+        users.objects.reverse()
+
+        assert 'user 1' == users[0]
+        assert 'user 1' == list(users)[0]
+
+    def test_all_returns_a_live_view(self):
+        users = self.store.all('user')
+        assert users is self.store.all('user')
+        assert 6 == len(users)
+
+        self.store.add('user 7', type_name='user')
+        assert 7 == len(users)
+        assert 'user 7' == users[6]
+        assert 'user 7' == users.user_7
+
+        # relocating an object keeps the view in sync
+        self.store.add('new user 1', type_name='user', entity_id=EntityID(identifier=1))
+        assert 'new user 1' == users.user_1
+        assert 'new user 1' == users[-1]
+
+        self.store.reset()
+        assert 0 == len(self.store.all('user'))
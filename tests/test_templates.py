@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship, object_session
+
+from scenarious import ScenariousException
+from scenarious.templates import SQLiteTemplate
+from scenarious.testing import scenario, ScenariousBaseTest
+from scenarious.type_handlers.base import faker
+from scenarious.type_handlers.sql_alchemy import SQLAlchemyTypeHandler
+
+
+Base = declarative_base()
+
+
+class Author(Base):
+    __tablename__ = 'authors'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+
+
+class Book(Base):
+    __tablename__ = 'books'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(64), nullable=False)
+    author_id = Column(Integer, ForeignKey('authors.id'), nullable=False)
+    author = relationship(Author)
+
+
+class AuthorTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'author'
+    __model__ = Author
+    __transactional__ = True
+
+    name = lambda: faker.name()
+
+
+class BookTypeHandler(SQLAlchemyTypeHandler):
+    __type_name__ = 'book'
+    __model__ = Book
+    __transactional__ = True
+    __requires__ = ['author_id']
+
+    title = lambda: faker.sentence()
+
+
+class UnboundAuthorTypeHandler(AuthorTypeHandler):
+
+    @classmethod
+    def _do_create(cls, data):
+        return Author(**data)
+
+
+SOURCE = """
+authors:
+  - name: borges
+    _alias: borges
+  - {}
+  - {}
+books:
+  - title: ficciones
+    author_id: $author_borges.id
+  - author_id: $author_3.id
+"""
+
+_tmp_dir = tempfile.mkdtemp()
+template = SQLiteTemplate(os.path.join(_tmp_dir, 'books.sqlite'), [SOURCE], [AuthorTypeHandler, BookTypeHandler],
+                          Base.metadata, seed=1)
+
+
+def tearDownModule():
+    shutil.rmtree(_tmp_dir)
+
+
+class SQLiteTemplateTest(unittest.TestCase):
+
+    def test_clones_are_copies_of_the_template(self):
+        first = template.clone()
+
+        session = AuthorTypeHandler.get_session()
+        assert session is BookTypeHandler.get_session()
+        assert 3 == session.query(Author).count()
+
+        borges = first.authors.author_borges
+        assert object_session(borges) is session
+        assert borges is first.books[0].author
+        assert 'ficciones' == first.books[0].title
+        names = [a.name for a in first.authors]
+
+        session.delete(first.books[1])
+        session.commit()
+        assert 1 == session.query(Book).count()
+        template.dispose(first)
+
+        second = template.clone()
+        self.addCleanup(template.dispose, second)
+        assert AuthorTypeHandler.get_session() is not session
+        assert 2 == AuthorTypeHandler.get_session().query(Book).count()
+        assert names == [a.name for a in second.authors]
+
+    def test_one_clone_at_a_time(self):
+        session = AuthorTypeHandler.__session__
+        first = template.clone()
+
+        self.assertRaises(ScenariousException, template.clone)
+        assert 'borges' == first.authors.author_borges.name
+
+        template.dispose(first)
+        assert AuthorTypeHandler.__session__ is session
+
+        second = template.clone()
+        template.dispose(second)
+
+    def test_template_is_built_again_when_the_source_changes(self):
+        path = os.path.join(_tmp_dir, 'changing.sqlite')
+
+        SQLiteTemplate(path, ['authors: 2'], [AuthorTypeHandler], Base.metadata).ensure()
+        built_at = os.path.getmtime(path)
+
+        os.utime(path, (0, 0))
+        SQLiteTemplate(path, ['authors: 2'], [AuthorTypeHandler], Base.metadata).ensure()
+        assert 0 == os.path.getmtime(path)
+
+        changed = SQLiteTemplate(path, ['authors: 5'], [AuthorTypeHandler], Base.metadata)
+        cloned = changed.clone()
+        self.addCleanup(changed.dispose, cloned)
+
+        assert os.path.getmtime(path) >= built_at
+        assert 5 == len(cloned.authors)
+
+    def test_handlers_must_create_objects_through_their_session(self):
+        path = os.path.join(_tmp_dir, 'unbound.sqlite')
+        unbound = SQLiteTemplate(path, ['authors: 2'], [UnboundAuthorTypeHandler], Base.metadata)
+
+        self.assertRaises(ScenariousException, unbound.ensure)
+        assert not os.path.exists(path)
+
+
+class SQLiteTemplateDecoratorTest(unittest.TestCase, ScenariousBaseTest):
+
+    @scenario(template=template)
+    def test_base_test_gets_a_copy(self):
+        assert 3 == len(self.authors)
+        assert 'borges' == self.author.name
+
+    @scenario(template=template)
+    def test_copies_are_disposed(self):
+        session = AuthorTypeHandler.get_session()
+        session.delete(self.books[0])
+        session.commit()
+
+        assert 1 == session.query(Book).count()
+
+
+class SQLiteTemplateInjectedTest(unittest.TestCase):
+
+    @scenario(template=template)
+    def test_scenario_is_injected(self, scenario):
+        assert 2 == len(scenario.books)
+        assert scenario.authors[2] is scenario.books[1].author
@@ -1,5 +1,7 @@
+import time
 import unittest
 from uuid import uuid4
+from datetime import datetime, date
 from random import randint
 
 try:
@@ -8,7 +10,8 @@ except ImportError:
     from io import StringIO
 
 from scenarious.util import DictObject
-from scenarious.type_handlers.base import faker, TypeHandlerException
+from scenarious.type_handlers.base import faker, parse_date, TypeHandlerException
+from scenarious.type_handlers.columns import IntegerColumn, ChoiceColumn, DateColumn, FakerColumn
 from scenarious import Scenario, TypeHandler
 
 
@@ -40,3 +43,104 @@ class TypeHandlerTest(unittest.TestCase):
             age = lambda: randint(18, 80)
 
         self.assertRaises(TypeHandlerException, ActorTypeHandler.validate_data, dict(age=30))
+
+    def test_template_is_computed_once_per_handler(self):
+        class ActorTypeHandler(BaseTestTypeHandler):
+            __type_name__ = 'actor'
+            __requires__ = ['name']
+
+            age = lambda: randint(18, 80)
+            country = 'AR'
+
+        class ChildActorTypeHandler(ActorTypeHandler):
+            age = lambda: randint(5, 12)
+
+        template = ActorTypeHandler.template()
+        assert template is ActorTypeHandler.template()
+        assert template is not ChildActorTypeHandler.template()
+
+        assert {'name'} == template.requirements
+        assert {'country': 'AR'} == template.defaults
+        assert ['age'] == [k for k, _ in template.generators]
+
+        actor = ChildActorTypeHandler.create(name='test')
+        assert 'AR' == actor.country
+        assert 5 <= actor.age <= 12
+
+    def test_create_with_custom_constructor(self):
+        class ActorTypeHandler(BaseTestTypeHandler):
+            __type_name__ = 'actor'
+            __requires__ = ['name']
+
+            def __init__(self, **kwargs):
+                super(ActorTypeHandler, self).__init__(**kwargs)
+                self.full_name = kwargs['name'] + ' ' + faker.last_name()
+
+        actor = ActorTypeHandler.create(name='test')
+        assert actor.full_name.startswith('test ')
+
+    def test_parse_dates(self):
+        class ActorTypeHandler(BaseTestTypeHandler):
+            __type_name__ = 'actor'
+            __date_formats__ = ['%d/%m/%Y']
+
+            @classmethod
+            def _is_datetime_attribute(cls, attr):
+                return attr == 'born'
+
+        class StrictActorTypeHandler(ActorTypeHandler):
+            __fuzzy_dates__ = False
+
+        assert datetime(1990, 5, 3) == ActorTypeHandler.create(born='1990-05-03').born
+        assert datetime(1990, 5, 3, 10, 30) == ActorTypeHandler.create(born='1990-05-03T10:30:00').born
+        assert datetime(1990, 5, 3) == ActorTypeHandler.create(born='03/05/1990').born
+        assert datetime(1990, 5, 3) == ActorTypeHandler.create(born='May 3 1990').born
+
+        assert datetime(1990, 5, 3) == StrictActorTypeHandler.create(born='03/05/1990').born
+        self.assertRaises(TypeHandlerException, StrictActorTypeHandler.create, born='May 3 1990')
+
+    def test_parsed_dates_are_cached(self):
+        assert parse_date('1990-05-03') is parse_date('1990-05-03')
+        assert parse_date('03/05/1990', ('%d/%m/%Y',)) is parse_date('03/05/1990', ('%d/%m/%Y',))
+
+    def test_fuzzy_dates_are_not_cached(self):
+        now = parse_date('now')
+        time.sleep(0.01)
+        assert parse_date('now') > now
+
+    def test_column_generators(self):
+        class ActorTypeHandler(BaseTestTypeHandler):
+            __type_name__ = 'actor'
+
+            name = FakerColumn('name')
+            age = IntegerColumn(18, 80, buffer_size=10)
+            country = ChoiceColumn(['AR', 'US'], weights=[0, 1])
+            born = DateColumn(date(1950, 1, 1), date(2000, 1, 1))
+
+        template = ActorTypeHandler.template()
+        assert ['age', 'born', 'country', 'name'] == sorted(k for k, _ in template.columns)
+        assert '_age' not in template.special_methods
+
+        # Created one by one, values come from the buffer
+        actor = ActorTypeHandler.create()
+        assert 9 == len(ActorTypeHandler.age._buffer)
+        assert 18 <= actor.age <= 80 and 'US' == actor.country and isinstance(actor.name, str)
+        assert 33 == ActorTypeHandler.create(age=33).age
+
+        # Default definitions generate every column at once
+        actors = Scenario.load({'actors': 50}, type_handlers=[ActorTypeHandler]).actors
+        assert 50 == len(actors)
+        assert 9 == len(ActorTypeHandler.age._buffer)
+        assert all(18 <= a.age <= 80 for a in actors)
+        assert all(date(1950, 1, 1) <= a.born <= date(2000, 1, 1) for a in actors)
+        assert len(set(a.name for a in actors)) > 1
+
+    def test_faker_column_pool(self):
+        column = FakerColumn('name', pool_size=20)
+        names = column.generate(100)
+
+        assert 100 == len(names)
+        assert 20 == len(column.pool())
+        assert set(names) <= set(column.pool())
+        # The pool has a seed of its own, so it's the same for every column of the same provider
+        assert column.pool() == FakerColumn('name', pool_size=20).pool()